@@ -0,0 +1,82 @@
+import json
+import time
+import random
+import asyncio
+import itertools
+from collections import Counter
+from contextvars import ContextVar
+
+from aiogram.client.session.base import BaseSession
+
+# Счётчики текущего апдейта: прогон подставляет словарь, сессия и SQL-события увеличивают значения
+update_counters = ContextVar("update_counters", default=None)
+
+
+def count(name, amount=1):
+    """Увеличивает счётчик `name` текущего апдейта (если апдейт замеряется)."""
+    counters = update_counters.get()
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + amount
+
+
+class FakeTelegramSession(BaseSession):
+    """
+    Сессия бота без сети: вместо запроса к Bot API ждёт `latency` ± `jitter` секунд и возвращает
+    правдоподобный ответ. Запрос сериализуется, а ответ разбирается так же, как в настоящей сессии,
+    поэтому их стоимость входит в замер. Все вызовы считаются по методам.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, bot_id=1, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.bot_id = bot_id
+        self.calls = Counter()  # метод Bot API -> число вызовов
+        self._message_ids = itertools.count(1_000_000)
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    def _message(self, chat_id, **fields):
+        return {"message_id": next(self._message_ids), "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, **fields}
+
+    def _photo(self):
+        file_id = f"bench-photo-{next(self._message_ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 800}]
+
+    def _result(self, method):
+        """Ответ Bot API на метод (поле `result`)."""
+        api_method = method.__api_method__
+        chat_id = getattr(method, "chat_id", None) or 0
+        if api_method == "getMe":
+            return {"id": self.bot_id, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if api_method == "getChatMember":
+            return {"status": "member", "user": {"id": method.user_id, "is_bot": False, "first_name": "Bench"}}
+        if api_method == "sendMediaGroup":
+            return [self._message(chat_id, photo=self._photo()) for _ in method.media]
+        if api_method == "sendPhoto":
+            return self._message(chat_id, photo=self._photo(), caption=method.caption)
+        if api_method.startswith("send") or api_method in ("copyMessage", "forwardMessage"):
+            return self._message(chat_id, text=getattr(method, "text", None) or "")
+        if api_method.startswith("edit"):
+            return self._message(chat_id, text=getattr(method, "text", None) or "")
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[method.__api_method__] += 1
+        count("api_calls")
+
+        files = {}
+        for value in method.model_dump(warnings=False).values():
+            self.prepare_value(value, bot=bot, files=files)  # Файлы не читаем, только сериализуем поля
+
+        delay = self.latency + random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        content = json.dumps({"ok": True, "result": self._result(method)})
+        response = self.check_response(bot=bot, method=method, status_code=200, content=content)
+        return response.result
@@ -0,0 +1,72 @@
+import uuid
+import asyncio
+import threading
+
+from aiohttp import web
+
+
+class FakeYooKassa:
+    """
+    Локальная заглушка API Юкасса: создание платежа отвечает через `latency` секунд.
+    Работает в отдельном потоке со своим циклом событий, чтобы не занимать цикл бота, как и настоящий внешний сервис.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1"):
+        self.latency = latency
+        self.host = host
+        self.url = None  # Базовый URL для `YOOKASSA_API_URL`, известен после `start()`
+        self.payments = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def _create_app(self):
+        async def create_payment(request):
+            payload = await request.json()
+            if self.latency > 0:
+                await asyncio.sleep(self.latency)
+            self.payments += 1
+            payment_id = str(uuid.uuid4())
+            return web.json_response({
+                "id": payment_id,
+                "status": "pending",
+                "amount": payload["amount"],
+                "confirmation": {"type": "redirect", "confirmation_url": f"https://yoomoney.example/checkout/{payment_id}"},
+            })
+
+        async def get_payment(request):
+            return web.json_response({"id": request.match_info["payment_id"], "status": "pending"})
+
+        app = web.Application()
+        app.router.add_post("/v3/payments", create_payment)
+        app.router.add_get("/v3/payments/{payment_id}", get_payment)
+        return app
+
+    async def _serve(self):
+        self._runner = web.AppRunner(self._create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{self.host}:{port}/v3/"
+
+    def start(self):
+        """Запускает заглушку и возвращает её базовый URL."""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._serve())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-yookassa", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,105 @@
+import itertools
+
+from aiogram.types import Update
+
+from helpers.callbacks import (
+    CategoriesCallback, SubcategoriesCallback, ProductsCallback, AddToCartCallback, ConfirmCartCallback,
+    CartCallback, CheckoutCallback,
+)
+from settings.config import CATEGORIES_PER_PAGE, PRODUCTS_PER_PAGE
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"Покупатель {user_id}", "username": f"bench{user_id}"}
+
+def message_update(user_id, text):
+    """Сообщение пользователя; команды (`/start`) размечаются как в настоящих апдейтах."""
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else None
+    return Update.model_validate({"update_id": next(_update_ids), "message": {
+        "message_id": next(_message_ids), "date": 0, "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id), "text": text, "entities": entities,
+    }})
+
+def callback_update(user_id, callback_data):
+    """Нажатие инлайн-кнопки с `callback_data` (фабрика из `helpers.callbacks`) под сообщением бота."""
+    data = callback_data.pack()
+    return Update.model_validate({"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)), "from": _user(user_id), "chat_instance": str(user_id), "data": data,
+        "message": {
+            "message_id": next(_message_ids), "date": 0, "chat": {"id": user_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Bench"}, "text": "…",
+        },
+    }})
+
+def inline_update(user_id, query):
+    """Инлайн-запрос (ввод текста после @бота)."""
+    return Update.model_validate({"update_id": next(_update_ids), "inline_query": {
+        "id": str(next(_update_ids)), "from": _user(user_id), "query": query, "offset": "",
+    }})
+
+
+def browse_catalog(catalog, user_id, rnd):
+    """Главное меню, две страницы категорий, подкатегории случайной категории."""
+    steps = [
+        ("start", message_update(user_id, "/start")),
+        ("category_page", callback_update(user_id, CategoriesCallback())),
+    ]
+    if len(catalog.category_ids) > CATEGORIES_PER_PAGE:
+        cursor = catalog.category_ids[CATEGORIES_PER_PAGE - 1]
+        steps.append(("category_page_next", callback_update(user_id, CategoriesCallback(page=2, after=cursor))))
+    steps.append(("subcategories", callback_update(user_id, SubcategoriesCallback(category_id=rnd.choice(catalog.category_ids)))))
+    return steps
+
+def page_products(catalog, user_id, rnd):
+    """Первая страница товаров подкатегории и листание вперёд на две страницы."""
+    subcategory_id = rnd.choice(list(catalog.product_ids))
+    product_ids = catalog.product_ids[subcategory_id]
+    steps = [("products", callback_update(user_id, ProductsCallback(subcategory_id=subcategory_id)))]
+    for page in (2, 3):
+        if len(product_ids) > (page - 1) * PRODUCTS_PER_PAGE:
+            cursor = product_ids[(page - 1) * PRODUCTS_PER_PAGE - 1]
+            steps.append(("products_next", callback_update(user_id, ProductsCallback(subcategory_id=subcategory_id, page=page, after=cursor))))
+    return steps
+
+def _add_to_cart_steps(catalog, user_id, rnd):
+    product_id = rnd.choice(rnd.choice(list(catalog.product_ids.values())))
+    return [
+        ("add_to_cart", callback_update(user_id, AddToCartCallback(product_id=product_id))),
+        ("quantity", message_update(user_id, str(rnd.randint(1, 5)))),
+        ("confirm_cart", callback_update(user_id, ConfirmCartCallback())),
+    ]
+
+def add_to_cart(catalog, user_id, rnd):
+    """Выбор товара, ввод количества и подтверждение."""
+    return _add_to_cart_steps(catalog, user_id, rnd)
+
+def view_cart(catalog, user_id, rnd):
+    """Просмотр корзины (в корзине `--cart-lines` строк и добавленные другими сценариями)."""
+    return [("view_cart", callback_update(user_id, CartCallback()))]
+
+def checkout(catalog, user_id, rnd):
+    """Добавление товара, оформление заказа с данными доставки и создание платежа."""
+    return _add_to_cart_steps(catalog, user_id, rnd) + [
+        ("checkout", callback_update(user_id, CheckoutCallback())),
+        ("delivery_info", message_update(user_id, f"г. Москва, ул. Тестовая, д. {rnd.randint(1, 200)}, +7 900 000-00-00")),
+    ]
+
+def faq_inline(catalog, user_id, rnd):
+    """Открытие инлайн-FAQ и посимвольный ввод темы вопроса."""
+    topic = rnd.choice(catalog.faq_topics).lower()
+    return [("faq_open", inline_update(user_id, ""))] + [
+        ("faq_typing", inline_update(user_id, topic[:length])) for length in range(1, len(topic) + 1)
+    ]
+
+
+SCENARIOS = {
+    "browse_catalog": browse_catalog,
+    "page_products": page_products,
+    "add_to_cart": add_to_cart,
+    "view_cart": view_cart,
+    "checkout": checkout,
+    "faq_inline": faq_inline,
+}
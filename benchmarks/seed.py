@@ -0,0 +1,113 @@
+from sqlalchemy.sql import text
+
+from helpers.database import engine, init_bot_tables, install_catalog_indexes, install_cart_unique_index
+
+# Таблицы, которыми управляет Django (tgshopadmin); в тестовой базе создаём их сами
+DJANGO_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS users_botuser (
+        id serial PRIMARY KEY, telegram_id bigint UNIQUE NOT NULL, username varchar(255),
+        first_name varchar(255) NOT NULL, last_name varchar(255), created_at timestamp)""",
+    """CREATE TABLE IF NOT EXISTS faq_question (id serial PRIMARY KEY, text varchar(255) NOT NULL, answer text NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS shop_category (id serial PRIMARY KEY, name varchar(255) NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS shop_subcategory (
+        id serial PRIMARY KEY, name varchar(255) NOT NULL, category_id int NOT NULL REFERENCES shop_category(id))""",
+    """CREATE TABLE IF NOT EXISTS shop_product (
+        id serial PRIMARY KEY, name varchar(255) NOT NULL, description text NOT NULL, price numeric(10, 2) NOT NULL,
+        subcategory_id int NOT NULL REFERENCES shop_subcategory(id), image varchar(255) NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS shop_cart (
+        id serial PRIMARY KEY, user_id int NOT NULL REFERENCES users_botuser(id),
+        product_id int NOT NULL REFERENCES shop_product(id), quantity int NOT NULL, added_at timestamp NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS shop_order (
+        id serial PRIMARY KEY, user_id int NOT NULL REFERENCES users_botuser(id),
+        created_at timestamp NOT NULL, delivery_info text NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS shop_orderitem (
+        id serial PRIMARY KEY, order_id int NOT NULL REFERENCES shop_order(id),
+        product_id int NOT NULL REFERENCES shop_product(id), quantity int NOT NULL)""",
+]
+
+SEEDED_TABLES = [
+    "shop_orderitem", "shop_order", "shop_cart", "shop_product", "shop_subcategory", "shop_category",
+    "faq_question", "users_botuser",
+    "bot_pending_payment", "bot_message_log", "bot_media_cache", "bot_fsm_state",
+]
+
+# Темы вопросов FAQ: по ним сценарий инлайн-поиска набирает запросы
+FAQ_TOPICS = ["Доставка", "Оплата", "Возврат", "Гарантия", "Самовывоз", "Скидки", "Размеры", "Контакты"]
+
+# Telegram ID первого тестового пользователя
+USER_ID_BASE = 900_000_000
+
+
+class Catalog:
+    """ID созданных строк, из которых сценарии собирают `callback_data`."""
+
+    def __init__(self, category_ids, subcategory_ids, product_ids, user_ids, faq_topics):
+        self.category_ids = category_ids
+        self.subcategory_ids = subcategory_ids  # ID категории -> ID подкатегорий
+        self.product_ids = product_ids  # ID подкатегории -> ID товаров
+        self.user_ids = user_ids  # Telegram ID пользователей
+        self.faq_topics = faq_topics
+
+
+async def seed_database(users, categories, subcategories_per_category, products_per_subcategory, faq_questions, cart_lines):
+    """
+    Очищает тестовую базу и заполняет её каталогом, вопросами FAQ, пользователями и их корзинами.
+    Возвращает `Catalog`.
+    """
+    await init_bot_tables()
+
+    async with engine.begin() as connection:
+        for statement in DJANGO_SCHEMA:
+            await connection.execute(text(statement))
+        await connection.execute(text(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY CASCADE"))
+
+        await connection.execute(text("""
+        INSERT INTO shop_category (name) SELECT 'Категория ' || g FROM generate_series(1, :categories) g
+        """), {"categories": categories})
+        await connection.execute(text("""
+        INSERT INTO shop_subcategory (name, category_id)
+        SELECT 'Подкатегория ' || c.id || '.' || g, c.id FROM shop_category c, generate_series(1, :per_category) g
+        ORDER BY c.id, g
+        """), {"per_category": subcategories_per_category})
+        await connection.execute(text("""
+        INSERT INTO shop_product (name, description, price, subcategory_id, image)
+        SELECT 'Товар ' || s.id || '.' || g, 'Описание товара ' || s.id || '.' || g || ': ' || repeat('характеристики ', 10),
+               round((100 + random() * 9900)::numeric, 2), s.id, 'products/bench-' || s.id || '-' || g || '.jpg'
+        FROM shop_subcategory s, generate_series(1, :per_subcategory) g
+        ORDER BY s.id, g
+        """), {"per_subcategory": products_per_subcategory})
+        await connection.execute(text("""
+        INSERT INTO faq_question (text, answer)
+        SELECT topics[1 + (g - 1) % cardinality(topics)] || ': вопрос ' || g || '?', 'Ответ на вопрос ' || g
+        FROM CAST(:topics AS text[]) topics, generate_series(1, :questions) g
+        """), {"topics": FAQ_TOPICS, "questions": faq_questions})
+        await connection.execute(text("""
+        INSERT INTO users_botuser (telegram_id, username, first_name, last_name, created_at)
+        SELECT :base + g, 'bench' || g, 'Покупатель ' || g, '', NOW() FROM generate_series(1, :users) g
+        """), {"base": USER_ID_BASE, "users": users})
+        # Каждому пользователю кладём в корзину `cart_lines` разных товаров
+        await connection.execute(text("""
+        INSERT INTO shop_cart (user_id, product_id, quantity, added_at)
+        SELECT u.id, p.id, 1 + (u.id + p.id) % 3, NOW()
+        FROM users_botuser u
+        CROSS JOIN LATERAL (
+            SELECT id FROM shop_product ORDER BY (id * 7919 + u.id) % 1000003 LIMIT :lines
+        ) p
+        """), {"lines": cart_lines})
+
+        category_ids = (await connection.execute(text("SELECT id FROM shop_category ORDER BY id"))).scalars().all()
+        subcategory_ids = {}
+        for category_id, subcategory_id in await connection.execute(text("SELECT category_id, id FROM shop_subcategory ORDER BY id")):
+            subcategory_ids.setdefault(category_id, []).append(subcategory_id)
+        product_ids = {}
+        for subcategory_id, product_id in await connection.execute(text("SELECT subcategory_id, id FROM shop_product ORDER BY id")):
+            product_ids.setdefault(subcategory_id, []).append(product_id)
+
+    await install_catalog_indexes()
+    await install_cart_unique_index()
+
+    async with engine.begin() as connection:
+        await connection.execute(text(f"ANALYZE {', '.join(SEEDED_TABLES)}"))
+
+    user_ids = [USER_ID_BASE + i for i in range(1, users + 1)]
+    return Catalog(category_ids, subcategory_ids, product_ids, user_ids, FAQ_TOPICS)
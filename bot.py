@@ -1,65 +1,239 @@
 import logging
 import asyncio
+import multiprocessing
 import os
-import logging
-from logging.handlers import RotatingFileHandler
+import signal
 
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, Router
 from aiogram.types import BotCommand
-from aiogram.filters import Command
 
-from helpers.utils import check_subscription
-from helpers.message_manager import delete_previous_message, save_last_message
-from settings.config import GROUP_ID, CHANNEL_ID
-from handlers.start_handler import router as start_router
+from helpers.database import (
+    engine, catalog_cache, user_id_cache, seen_user_cache, get_pool_metrics,
+    init_bot_tables, install_catalog_indexes, install_cart_unique_index, install_change_triggers, listen_table_changes,
+)
+from helpers.order_export import order_exporter
+from helpers.media_cache import install_media_cache_trigger
+from helpers.message_store import run_message_store_maintenance
+from helpers.fsm_storage import fsm_storage, run_fsm_storage_maintenance
+from helpers.payments import yookassa, run_payment_reconciler, start_payment_webhook
+from helpers.callbacks import callback_router
+from helpers.logging_setup import setup_logging
+from helpers.metrics import registry, flatten_stats, instrument_engine, HandlerMetricsMiddleware, TelegramMetricsMiddleware, start_metrics_server
+from helpers.middlewares import LogContextMiddleware, UserIdMiddleware
+from helpers.send_scheduler import send_scheduler
+from helpers.webhook import BOT_MODE, WEBHOOK_URL, WEBHOOK_SECRET, WEB_WORKERS, start_webhook_server, set_bot_webhook
+from settings.config import MESSAGE_STORE_BACKEND, MESSAGE_STORE_EVICT_INTERVAL, FSM_STORAGE, FSM_STORAGE_CLEANUP_INTERVAL
+from handlers.start_handler import router as start_router, stale_buttons_router
 from handlers.faq_handler import router as faq_router
-from handlers.category_handler import router as category_router
-from handlers.subcategory_handler import router as subcategory_router
-from handlers.product_handler import router as product_router
+import handlers.category_handler, handlers.subcategory_handler, handlers.product_handler  # Регистрируют кнопки в `callback_router`
 from handlers.cart_handler import router as cart_router
-from handlers.order_handler import router as order_router
+from handlers.order_handler import router as order_router, handle_paid_order
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        RotatingFileHandler("bot.log", maxBytes=5_000_000, backupCount=3, encoding="utf-8"),  # Логи сохраняются в файл размером до 5MB, храним 3 файла
-        logging.StreamHandler()  # Логи выводятся в консоль
-    ]
-)
+# Логи пишет отдельный поток, записи в формате JSON с ID пользователя и апдейта
+setup_logging()
 
 logger = logging.getLogger(__name__)
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot.session.middleware(send_scheduler)  # Все запросы к Telegram идут через планировщик с лимитами частоты
+bot.session.middleware(TelegramMetricsMiddleware())  # Время запросов к Bot API (без ожидания в планировщике)
+dp = Dispatcher(storage=fsm_storage)  # Состояния диалогов (ввод количества, данных доставки)
 router = Router()
 dp.include_router(router)
 
+# ID апдейта и пользователя попадают во все записи лога при его обработке
+dp.update.outer_middleware(LogContextMiddleware())
+
+# Определяем `users_botuser.id` один раз на апдейт и передаём в обработчики как `user_db_id`
+dp.message.middleware(UserIdMiddleware())
+dp.callback_query.middleware(UserIdMiddleware())
+
+# Метрики: время и ошибки обработчиков, время SQL-запросов, состояние кэшей, пула и очередей
+for observer in (dp.message, dp.callback_query, dp.inline_query):
+    observer.middleware(HandlerMetricsMiddleware())
+instrument_engine(engine)
+registry.collector("tgshop_cache", "Состояние кэшей", lambda: {
+    **flatten_stats(catalog_cache.stats(), ("stat",), [("cache", "catalog")]),
+    **flatten_stats(user_id_cache.stats(), ("stat",), [("cache", "user_id")]),
+    **flatten_stats(seen_user_cache.stats(), ("stat",), [("cache", "seen_user")]),
+})
+registry.collector("tgshop_db_pool", "Состояние пула соединений с БД", lambda: flatten_stats(get_pool_metrics(), ("stat",)))
+registry.collector("tgshop_yookassa", "Запросы к API Юкасса", lambda: flatten_stats(yookassa.stats(), ("operation", "stat")))
+registry.collector("tgshop_send_scheduler", "Очереди планировщика отправки", lambda: flatten_stats(send_scheduler.stats(), ("stat", "priority")))
+
 # Подключаем хендлеры
+dp.include_router(callback_router)  # Кнопки всех разделов: обработчик выбирается по префиксу `callback_data`
 dp.include_router(start_router)
 dp.include_router(faq_router)
-dp.include_router(category_router)
-dp.include_router(subcategory_router)
-dp.include_router(product_router)
 dp.include_router(cart_router)
 dp.include_router(order_router)
+dp.include_router(stale_buttons_router)  # Устаревшие кнопки — после всех остальных
+
+async def init_database():
+    """
+    Создаёт таблицы бота (`bot_*`), если их нет. Вызывается до приёма обновлений и до запуска
+    дополнительных процессов, чтобы хранилища `sql` не работали с несуществующими таблицами.
+    """
+    try:
+        await init_bot_tables()
+    except Exception as e:
+        logger.error("Не удалось создать таблицы бота, хранилища `sql` и платежи не будут работать: %s", e)
+
+async def prepare_webhook_workers():
+    """
+    Подготавливает базу до запуска процессов webhook и закрывает соединения,
+    чтобы процессы не унаследовали их при fork.
+    """
+    try:
+        await init_database()
+    finally:
+        await engine.dispose()
+
+async def start_services(worker=0):
+    """
+    Запускает фоновые службы бота. Общие для всех процессов задачи (команды, триггеры, индексы, Excel,
+    приём уведомлений Юкасса) выполняет только основной процесс `worker` 0. Возвращает функцию остановки служб.
+    """
+    primary = worker == 0
+    if primary:
+        await bot.set_my_commands([  # Устанавливаем команды бота перед запуском
+            BotCommand(command="start", description="Меню"),
+            BotCommand(command="cart", description="Корзина"),
+            BotCommand(command="faq", description="FAQ")
+        ])
+
+        # Триггеры уведомлений об изменениях каталога
+        try:
+            await install_change_triggers()
+        except Exception as e:
+            logger.warning("Не удалось установить триггеры уведомлений, кэш каталога обновляется только по TTL: %s", e)
+
+        # Индексы под постраничный вывод каталога
+        try:
+            await install_catalog_indexes()
+        except Exception as e:
+            logger.warning("Не удалось создать индексы каталога: %s", e)
+
+        # Уникальный индекс корзины: без него добавление в корзину (`ON CONFLICT`) не работает
+        try:
+            await install_cart_unique_index()
+        except Exception as e:
+            logger.error("Не удалось создать уникальный индекс корзины, добавление в корзину не будет работать: %s", e)
+
+        # Сброс `file_id` при замене изображения товара (в том числе файлом с тем же именем)
+        try:
+            await install_media_cache_trigger()
+        except Exception as e:
+            logger.warning("Не удалось установить триггер кэша изображений, заменённые картинки могут не обновиться: %s", e)
+
+    # Подписка на изменения каталога для сброса кэша (кэш у каждого процесса свой)
+    listener_task = asyncio.create_task(listen_table_changes())
 
-async def main():
-    await bot.set_my_commands([  # Устанавливаем команды бота перед запуском
-        BotCommand(command="start", description="Меню"),
-        BotCommand(command="cart", description="Корзина"),
-        BotCommand(command="faq", description="FAQ")
-    ])
-    await dp.start_polling(bot)  # Запуск бота
-    await bot.session.close()  # Корректное закрытие сессии
+    # Журнал заказов пишут все процессы, Excel собирает только основной
+    order_exporter.build_workbooks = primary
+    order_exporter.start()
+
+    # Сверка платежей безопасна для нескольких процессов, уведомления Юкасса принимает основной
+    reconciler_task = asyncio.create_task(run_payment_reconciler(bot, handle_paid_order))
+    payment_webhook = await start_payment_webhook(bot, handle_paid_order) if primary else None
+    message_store_task = asyncio.create_task(run_message_store_maintenance(MESSAGE_STORE_EVICT_INTERVAL))
+    fsm_storage_task = asyncio.create_task(run_fsm_storage_maintenance(FSM_STORAGE_CLEANUP_INTERVAL)) if primary else None
+    metrics_server = await start_metrics_server(worker)
+
+    async def stop_services():
+        listener_task.cancel()
+        reconciler_task.cancel()
+        message_store_task.cancel()
+        if fsm_storage_task:
+            fsm_storage_task.cancel()
+        if payment_webhook:
+            await payment_webhook.cleanup()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await yookassa.close()
+        await asyncio.to_thread(order_exporter.stop)  # Переносим последние заказы из журнала в Excel
+        await dp.storage.close()
+        await bot.session.close()  # Корректное закрытие сессии
+
+    return stop_services
+
+async def run_polling():
+    """
+    Получение обновлений через long polling (один процесс).
+    """
+    await init_database()
+    stop_services = await start_services()
+    try:
+        await bot.delete_webhook()  # getUpdates не работает, пока установлен webhook
+        await dp.start_polling(bot)  # Запуск бота
+    finally:
+        await stop_services()
+
+async def run_webhook(worker):
+    """
+    Получение обновлений через webhook. Процесс `worker` 0 — основной: он регистрирует webhook в Telegram.
+    """
+    primary = worker == 0
+    stop_services = await start_services(worker)
+    runner = await start_webhook_server(dp, bot, worker)
+    try:
+        if primary:
+            await set_bot_webhook(bot, dp.resolve_used_update_types())
+        # Работаем до SIGTERM/SIGINT, затем корректно останавливаемся
+        stop_event = asyncio.Event()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(signal_number, stop_event.set)
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()  # Дожидается обработки уже принятых обновлений
+        await stop_services()
+
+def run_webhook_worker(worker):
+    if worker:
+        setup_logging(f"bot-{worker}.log")  # Поток логирования не наследуется при fork, у каждого процесса свой файл
+    asyncio.run(run_webhook(worker))
+
+def main():
+    if BOT_MODE == "polling":
+        asyncio.run(run_polling())  # Запуск с автоматическим управлением событиями
+        return
+
+    if BOT_MODE != "webhook":
+        raise ValueError(f"Неизвестный режим BOT_MODE: {BOT_MODE}")
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise ValueError("Для режима webhook задайте WEBHOOK_URL и WEBHOOK_SECRET")
+
+    if WEB_WORKERS > 1 and MESSAGE_STORE_BACKEND == "memory":
+        logger.warning(
+            "При WEB_WORKERS > 1 обновления одного пользователя попадают в разные процессы: "
+            "используйте MESSAGE_STORE_BACKEND = \"sql\", иначе старые сообщения удаляются не все."
+        )
+    if WEB_WORKERS > 1 and FSM_STORAGE == "memory":
+        logger.warning(
+            "При WEB_WORKERS > 1 используйте FSM_STORAGE = \"sql\", иначе ввод количества и данных доставки "
+            "теряется, если следующее сообщение пользователя попадает в другой процесс."
+        )
+
+    # Таблицы создаются один раз до запуска процессов: все они начинают принимать обновления одновременно
+    asyncio.run(prepare_webhook_workers())
+
+    # Дополнительные процессы запускаются до создания цикла событий и соединений
+    workers = [multiprocessing.Process(target=run_webhook_worker, args=(worker,), daemon=True) for worker in range(1, WEB_WORKERS)]
+    for process in workers:
+        process.start()
+    try:
+        run_webhook_worker(0)
+    finally:
+        for process in workers:
+            process.terminate()
+            process.join()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())  # Запуск с автоматическим управлением событиями
+        main()
     except KeyboardInterrupt:
         logging.info("Бот остановлен вручную")
-
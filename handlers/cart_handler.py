@@ -1,8 +1,19 @@
 import logging
-from aiogram import Router, types
+from aiogram import Router, types, F
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
 from sqlalchemy.sql import text
-from helpers.database import add_to_cart, async_session_maker
-from helpers.message_manager import last_message, delete_previous_message, save_last_message, delete_all_previous_messages
+from helpers.callbacks import (
+    callback_router, MainMenuCallback, AddToCartCallback, ConfirmCartCallback, CartCallback,
+    CartPageCallback, CartLineCallback, RemoveFromCartCallback, UpdateCartCallback, CheckoutCallback,
+)
+from helpers.database import (
+    add_to_cart, async_session_maker, get_product, get_cart_page, change_cart_quantity, remove_from_cart,
+)
+from helpers.media_cache import send_product_photo
+from helpers.message_manager import delete_previous_message, save_last_message, delete_all_previous_messages
+from helpers.states import CartStates
+from settings.config import CART_VIEW_MODE, CART_ITEMS_PER_PAGE
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -10,19 +21,23 @@ router = Router()
 # Создаём хранилище ID последних 3 сообщений с товарами
 user_messages = {}
 
-# Объявляем `cart_sessions` как глобальную переменную
-cart_sessions = {}
-
-@router.callback_query(lambda callback_query: callback_query.data.startswith("add_to_cart_"))
-async def ask_quantity_handler(callback_query: types.CallbackQuery):
+@callback_router.button(AddToCartCallback)
+async def ask_quantity_handler(callback_query: types.CallbackQuery, callback_data: AddToCartCallback, state: FSMContext):
     """
     Запрашивает у пользователя количество товара перед добавлением в корзину.
     """
     user_id = callback_query.from_user.id
-    product_id = int(callback_query.data.split("_")[-1])
-    product_name = callback_query.message.caption.split("\n")[0]
+    product_id = callback_data.product_id
+
+    # Название берём из каталога: в режиме альбома кнопка находится не под фото товара
+    product = await get_product(product_id)
+    if product is None:
+        logger.warning("⚠ Товар `%s` не найден.", product_id)
+        await callback_query.answer("❌ Товар не найден.")
+        return
+    product_name = product.name
 
-    logger.info(f"Пользователь {user_id} выбрал товар {product_id}, запрашиваем количество.")
+    logger.info("Пользователь %s выбрал товар %s, запрашиваем количество.", user_id, product_id)
 
     # Удаляем ВСЕ предыдущие сообщения с товарами
     await delete_all_previous_messages(callback_query.message.bot, user_id)
@@ -35,11 +50,12 @@ async def ask_quantity_handler(callback_query: types.CallbackQuery):
     # Сохраняем ID последнего отправленного сообщения
     await save_last_message(user_id, sent_message)
 
-    # Сохраняем product_id во временное хранилище
-    cart_sessions[user_id] = {"product_id": product_id, "product_name": product_name}
+    # Сохраняем product_id в состояние диалога
+    await state.set_state(CartStates.add_quantity)
+    await state.set_data({"product_id": product_id, "product_name": product_name})
 
-@router.message(lambda message: message.text.isdigit() and message.from_user.id in cart_sessions)
-async def confirm_cart_handler(message: types.Message):
+@router.message(CartStates.add_quantity, F.text.isdigit())
+async def confirm_cart_handler(message: types.Message, state: FSMContext):
     """
     Подтверждает добавление товара в корзину.
     """
@@ -60,12 +76,12 @@ async def confirm_cart_handler(message: types.Message):
 
         return
 
-    product_name = cart_sessions[user_id]["product_name"]
-    cart_sessions[user_id]["quantity"] = quantity
+    data = await state.update_data(quantity=quantity)
+    product_name = data["product_name"]
 
     confirm_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-        [types.InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_cart")],
-        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")]
+        [types.InlineKeyboardButton(text="✅ Подтвердить", callback_data=ConfirmCartCallback().pack())],
+        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
     ])
 
     sent_message = await message.answer(f"Ты действительно хочешь добавить в корзину {quantity} шт. товара {product_name}?", reply_markup=confirm_keyboard)
@@ -74,8 +90,8 @@ async def confirm_cart_handler(message: types.Message):
     await save_last_message(user_id, sent_message)
 
 
-@router.callback_query(lambda callback_query: callback_query.data == "confirm_cart")
-async def add_cart_handler(callback_query: types.CallbackQuery):
+@callback_router.button(ConfirmCartCallback)
+async def add_cart_handler(callback_query: types.CallbackQuery, state: FSMContext, user_db_id: int | None = None):
     """
     Добавляет товар в корзину после подтверждения.
     """
@@ -87,7 +103,8 @@ async def add_cart_handler(callback_query: types.CallbackQuery):
     # Объявляем переменную sent_message
     sent_message = None  
 
-    if user_id not in cart_sessions:
+    data = await state.get_data()
+    if "quantity" not in data:
         sent_message = await callback_query.message.answer("❌ Ошибка! Сначала укажи количество товара.")
 
         # Сохраняем ID последнего отправленного сообщения
@@ -95,16 +112,24 @@ async def add_cart_handler(callback_query: types.CallbackQuery):
 
         return
 
-    product_id = cart_sessions[user_id]["product_id"]
-    product_name = cart_sessions[user_id]["product_name"]
-    quantity = cart_sessions[user_id]["quantity"]
+    product_id = data["product_id"]
+    product_name = data["product_name"]
+    quantity = data["quantity"]
 
-    await add_to_cart(user_id, product_id, quantity)
+    # Завершаем диалог сразу: повторное нажатие "✅ Подтвердить" не добавит товар второй раз
+    await state.clear()
+
+    # Один запрос: пользователь ищется по Telegram ID внутри него, если его ID ещё не известен
+    if await add_to_cart(user_db_id, product_id, quantity, telegram_id=user_id) is None:
+        logger.error("Ошибка! `telegram_id=%s` не найден в `users_botuser`.", user_id)
+        sent_message = await callback_query.message.answer("❌ Ошибка! Ваш профиль не найден.")
+        await save_last_message(user_id, sent_message)
+        return
 
     # Создаём клавиатуру с кнопками
     cart_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-        [types.InlineKeyboardButton(text="🛒 Перейти в корзину", callback_data="view_cart")],
-        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")]
+        [types.InlineKeyboardButton(text="🛒 Перейти в корзину", callback_data=CartCallback().pack())],
+        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
     ])
 
     sent_message = await callback_query.message.answer(
@@ -114,36 +139,91 @@ async def add_cart_handler(callback_query: types.CallbackQuery):
     # Сохраняем ID последнего отправленного сообщения
     await save_last_message(user_id, sent_message)
 
-    # Удаляем сессию после добавления
-    del cart_sessions[user_id]
+EMPTY_CART_TEXT = "🛒 Ваша корзина пуста!"
 
-@router.callback_query(lambda callback_query: callback_query.data == "view_cart")
-async def view_cart_handler(event: types.Message | types.CallbackQuery, user_id=None):
+def render_compact_cart(cart_page):
     """
-    Показывает корзину пользователя в виде карточек товаров.
+    Собирает текст и клавиатуру компактной корзины по результату `get_cart_page`:
+    позиции текущей страницы с кнопками ➖/➕/❌, листание и итог по всей корзине.
+    """
+    rows, page, lines, items, total = cart_page
+    pages = (lines + CART_ITEMS_PER_PAGE - 1) // CART_ITEMS_PER_PAGE
+    first_number = (page - 1) * CART_ITEMS_PER_PAGE + 1
+
+    text_lines = [f"🛒 Ваша корзина: {lines} поз., {items} шт.", ""]
+    keyboard = []
+    for number, row in enumerate(rows, start=first_number):
+        text_lines.append(f"{number}. {row.name} — {row.quantity} × {row.price} ₽ = {row.price * row.quantity} ₽")
+        keyboard.append([
+            types.InlineKeyboardButton(text=f"➖ {number}", callback_data=CartLineCallback(product_id=row.id, action="d", page=page).pack()),
+            types.InlineKeyboardButton(text=f"➕ {number}", callback_data=CartLineCallback(product_id=row.id, action="i", page=page).pack()),
+            types.InlineKeyboardButton(text=f"❌ {number}", callback_data=CartLineCallback(product_id=row.id, action="r", page=page).pack()),
+        ])
+
+    if pages > 1:
+        text_lines.append(f"\nСтраница {page} из {pages}")
+        navigation = []
+        if page > 1:
+            navigation.append(types.InlineKeyboardButton(text="⬅️ Назад", callback_data=CartPageCallback(page=page - 1).pack()))
+        if page < pages:
+            navigation.append(types.InlineKeyboardButton(text="➡️ Вперёд", callback_data=CartPageCallback(page=page + 1).pack()))
+        keyboard.append(navigation)
+
+    text_lines.append(f"\nИтого: {total} ₽")
+    keyboard.append([types.InlineKeyboardButton(text="📦 Оформить заказ", callback_data=CheckoutCallback().pack())])
+    keyboard.append([types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())])
+    return "\n".join(text_lines), types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+async def edit_compact_cart(callback_query: types.CallbackQuery, user_db_id, page):
+    """
+    Перерисовывает компактную корзину в том же сообщении (один вызов Bot API при любом числе позиций).
+    """
+    cart_page = await get_cart_page(user_db_id, page, CART_ITEMS_PER_PAGE)
+    if cart_page is None:
+        text_message, keyboard = EMPTY_CART_TEXT, types.InlineKeyboardMarkup(inline_keyboard=[
+            [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
+        ])
+    else:
+        text_message, keyboard = render_compact_cart(cart_page)
+
+    try:
+        await callback_query.message.edit_text(text_message, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        # Повторное нажатие на ту же страницу ничего не меняет — это не ошибка
+        if "message is not modified" not in str(e):
+            raise
+
+@callback_router.button(CartCallback)
+async def view_cart_handler(event: types.Message | types.CallbackQuery, user_id=None, user_db_id: int | None = None):
+    """
+    Показывает корзину пользователя: карточками товаров или, при `CART_VIEW_MODE = "compact"`,
+    одним сообщением со списком позиций.
     """
     user_id = user_id or event.from_user.id  
-    logger.info(f"Получаем `id` для `telegram_id={user_id}`.")
 
     # Удаляем все предыдущие сообщения
     bot_instance = event.message.bot if isinstance(event, types.CallbackQuery) else event.bot
     await delete_all_previous_messages(bot_instance, user_id)
 
-    async with async_session_maker() as session:
-        user_check_query = text("SELECT id FROM users_botuser WHERE telegram_id = :user_id")
-        result = await session.execute(user_check_query, {"user_id": user_id})
-        user_db_id = result.scalar()
-
-        if not user_db_id:
-            logger.warning(f"Ошибка! `telegram_id={user_id}` не найден в `users_botuser`.")
-            await (event.message.answer("❌ Ошибка! Ваш профиль не найден.") if isinstance(event, types.CallbackQuery) else event.answer("❌ Ошибка! Ваш профиль не найден."))
-            return
+    if not user_db_id:
+        logger.warning("Ошибка! `telegram_id=%s` не найден в `users_botuser`.", user_id)
+        await (event.message.answer("❌ Ошибка! Ваш профиль не найден.") if isinstance(event, types.CallbackQuery) else event.answer("❌ Ошибка! Ваш профиль не найден."))
+        return
 
-        await session.commit()
-        session.expire_all()
+    logger.info("Загружаем корзину пользователя `id=%s`...", user_db_id)
 
-        logger.info(f"`id={user_db_id}` найден! Загружаем корзину...")
+    if CART_VIEW_MODE == "compact":
+        answer = event.message.answer if isinstance(event, types.CallbackQuery) else event.answer
+        cart_page = await get_cart_page(user_db_id, 1, CART_ITEMS_PER_PAGE)
+        if cart_page is None:
+            await answer(EMPTY_CART_TEXT)
+            return
+        text_message, keyboard = render_compact_cart(cart_page)
+        sent_message = await answer(text_message, reply_markup=keyboard)
+        await save_last_message(user_id, sent_message)
+        return
 
+    async with async_session_maker() as session:
         cart_query = text("""
         SELECT shop_product.id, shop_product.name, shop_product.price, shop_product.image, shop_cart.quantity
         FROM shop_cart
@@ -153,92 +233,109 @@ async def view_cart_handler(event: types.Message | types.CallbackQuery, user_id=
         result = await session.execute(cart_query, {"user_db_id": user_db_id})
         cart_items = result.fetchall()
 
-    logger.info(f"Найдено товаров в корзине: {len(cart_items)}")
+    logger.info("Найдено товаров в корзине: %s", len(cart_items))
 
     if not cart_items:
-        logger.warning(f"Корзина пуста для пользователя `id={user_db_id}`!")
+        logger.warning("Корзина пуста для пользователя `id=%s`!", user_db_id)
         await (event.message.answer("🛒 Ваша корзина пуста!") if isinstance(event, types.CallbackQuery) else event.answer("🛒 Ваша корзина пуста!"))
         return
 
-    if user_id not in last_message:
-        last_message[user_id] = []
-
     for item in cart_items:
         product_id, product_name, price, image_url, quantity = item
-        logger.info(f"Товар в корзине: {product_name}, Количество: {quantity}")
+        logger.info("Товар в корзине: %s, Количество: %s", product_name, quantity)
 
         cart_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-            [types.InlineKeyboardButton(text="❌ Удалить", callback_data=f"remove_{product_id}")],
-            [types.InlineKeyboardButton(text="✏ Изменить количество", callback_data=f"update_{product_id}")]
+            [types.InlineKeyboardButton(text="❌ Удалить", callback_data=RemoveFromCartCallback(product_id=product_id).pack())],
+            [types.InlineKeyboardButton(text="✏ Изменить количество", callback_data=UpdateCartCallback(product_id=product_id).pack())]
         ])
 
-        sent_message = await (event.message.answer_photo(photo=image_url, caption=f"**{product_name}**\nЦена: {price} ₽\nКоличество: {quantity} шт.", reply_markup=cart_keyboard, parse_mode="Markdown") if isinstance(event, types.CallbackQuery) else event.answer_photo(photo=image_url, caption=f"**{product_name}**\nЦена: {price} ₽\nКоличество: {quantity} шт.", reply_markup=cart_keyboard, parse_mode="Markdown"))
+        answer_photo = event.message.answer_photo if isinstance(event, types.CallbackQuery) else event.answer_photo
+        sent_message = await send_product_photo(answer_photo, product_id, image_url, caption=f"**{product_name}**\nЦена: {price} ₽\nКоличество: {quantity} шт.", reply_markup=cart_keyboard, parse_mode="Markdown")
 
-        logger.info(f"Сохраняем ID сообщения `{sent_message.message_id}` для пользователя `{user_id}`.")
-        last_message[user_id].append(sent_message.message_id)
+        await save_last_message(user_id, sent_message)
 
     general_cart_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-        [types.InlineKeyboardButton(text="📦 Оформить заказ", callback_data="checkout")],
-        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")]
+        [types.InlineKeyboardButton(text="📦 Оформить заказ", callback_data=CheckoutCallback().pack())],
+        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
     ])
 
     general_message = await (event.message.answer("Выберите действие 👇", reply_markup=general_cart_keyboard) if isinstance(event, types.CallbackQuery) else event.answer("Выберите действие 👇", reply_markup=general_cart_keyboard))
 
-    logger.info(f"Сохраняем ID сообщения `{general_message.message_id}` с кнопками для пользователя `{user_id}`.")
-    last_message[user_id].append(general_message.message_id)
+    await save_last_message(user_id, general_message)
 
 
-@router.callback_query(lambda callback_query: callback_query.data.startswith("remove_"))
-async def remove_from_cart_handler(callback_query: types.CallbackQuery):
+@callback_router.button(CartPageCallback)
+async def cart_page_handler(callback_query: types.CallbackQuery, callback_data: CartPageCallback, user_db_id: int | None = None):
     """
-    Удаляет товар из корзины, очищает ВСЕ предыдущие сообщения и показывает обновлённую корзину.
+    Листает компактную корзину.
     """
-    telegram_id = callback_query.from_user.id
-    product_id = int(callback_query.data.split("_")[-1])
+    if not user_db_id:
+        await callback_query.answer("❌ Ошибка! Ваш профиль не найден.")
+        return
 
-    logger.info(f"Удаляем товар {product_id} из корзины пользователя `{telegram_id}`...")
+    await edit_compact_cart(callback_query, user_db_id, callback_data.page)
+    await callback_query.answer()
 
-    async with async_session_maker() as session:
-        user_check_query = text("SELECT id FROM users_botuser WHERE telegram_id = :telegram_id")
-        result = await session.execute(user_check_query, {"telegram_id": telegram_id})
-        user_db_id = result.scalar()
+@callback_router.button(CartLineCallback)
+async def cart_line_handler(callback_query: types.CallbackQuery, callback_data: CartLineCallback, user_db_id: int | None = None):
+    """
+    Кнопки ➖/➕/❌ компактной корзины: меняет позицию и перерисовывает корзину на месте.
+    """
+    if not user_db_id:
+        await callback_query.answer("❌ Ошибка! Ваш профиль не найден.")
+        return
 
-        if not user_db_id:
-            logger.warning(f"⚠ Ошибка! `telegram_id={telegram_id}` не найден в `users_botuser`.")
-            await callback_query.message.answer("❌ Ошибка! Ваш профиль не найден.")
-            return
+    product_id = callback_data.product_id
+    if callback_data.action == "r":
+        await remove_from_cart(user_db_id, product_id)
+        notice = "❌ Товар удалён из корзины."
+    else:
+        quantity = await change_cart_quantity(user_db_id, product_id, 1 if callback_data.action == "i" else -1)
+        if quantity is None:
+            notice = "⚠ Этого товара уже нет в корзине."
+        elif quantity == 0:
+            notice = "❌ Товар удалён из корзины."
+        else:
+            notice = f"✅ Количество: {quantity} шт."
+
+    logger.info("Корзина пользователя `id=%s`: товар %s, действие %s.", user_db_id, product_id, callback_data.action)
+
+    await edit_compact_cart(callback_query, user_db_id, callback_data.page)
+    await callback_query.answer(notice)
+
+@callback_router.button(RemoveFromCartCallback)
+async def remove_from_cart_handler(callback_query: types.CallbackQuery, callback_data: RemoveFromCartCallback, user_db_id: int | None = None):
+    """
+    Удаляет товар из корзины, очищает ВСЕ предыдущие сообщения и показывает обновлённую корзину.
+    """
+    telegram_id = callback_query.from_user.id
+    product_id = callback_data.product_id
 
-        await session.commit()
-        session.expire_all()
+    logger.info("Удаляем товар %s из корзины пользователя `%s`...", product_id, telegram_id)
 
-        logger.info(f"✅ `id={user_db_id}` найден! Удаляем товар...")
+    if not user_db_id:
+        logger.warning("⚠ Ошибка! `telegram_id=%s` не найден в `users_botuser`.", telegram_id)
+        await callback_query.message.answer("❌ Ошибка! Ваш профиль не найден.")
+        return
 
-        remove_query = text("DELETE FROM shop_cart WHERE user_id = :user_db_id AND product_id = :product_id")
-        await session.execute(remove_query, {"user_db_id": user_db_id, "product_id": product_id})
-        await session.commit()
+    await remove_from_cart(user_db_id, product_id)
 
     await callback_query.message.answer(f"❌ Товар удалён из корзины!")
 
-    # Создаём копию списка сообщений перед удалением
-    messages_to_delete = last_message.get(telegram_id, []).copy()
-    
-    if messages_to_delete:
-        logger.info(f"🚀 Полностью очищаем ВСЕ сообщения пользователя `{telegram_id}` перед обновлением корзины.")
-        await delete_all_previous_messages(callback_query.message.bot, telegram_id)
-    
-        # После удаления всех сообщений, очищаем `last_message[user_id]`
-        last_message[telegram_id] = []
+    # Полностью очищаем ВСЕ сообщения пользователя перед обновлением корзины
+    logger.info("🚀 Полностью очищаем ВСЕ сообщения пользователя `%s` перед обновлением корзины.", telegram_id)
+    await delete_all_previous_messages(callback_query.message.bot, telegram_id)
 
     # Показываем обновлённую корзину
-    await view_cart_handler(callback_query)
+    await view_cart_handler(callback_query, user_db_id=user_db_id)
 
-@router.callback_query(lambda callback_query: callback_query.data.startswith("update_"))
-async def update_quantity_handler(callback_query: types.CallbackQuery):
+@callback_router.button(UpdateCartCallback)
+async def update_quantity_handler(callback_query: types.CallbackQuery, callback_data: UpdateCartCallback, state: FSMContext):
     """
     Запрашивает новое количество товара в корзине и загружает `product_name`.
     """
     user_id = callback_query.from_user.id
-    product_id = int(callback_query.data.split("_")[-1])
+    product_id = callback_data.product_id
 
     # Удаляем ВСЕ предыдущие сообщения с товарами
     await delete_all_previous_messages(callback_query.message.bot, user_id)
@@ -253,21 +350,22 @@ async def update_quantity_handler(callback_query: types.CallbackQuery):
         product_name = result.scalar()
 
         if not product_name:
-            logger.warning(f"⚠ Ошибка! `product_name` не найден для `product_id={product_id}`.")
+            logger.warning("⚠ Ошибка! `product_name` не найден для `product_id=%s`.", product_id)
             await callback_query.message.answer("❌ Ошибка! Товар не найден.")
             return
 
-    logger.info(f"✏ Изменение количества товара `{product_name}` для пользователя `{user_id}`.")
+    logger.info("✏ Изменение количества товара `%s` для пользователя `%s`.", product_name, user_id)
 
     sent_message = await callback_query.message.answer(f"✏ Введите новое количество для товара **{product_name}**:", parse_mode="Markdown")
 
     # Сохраняем ID последнего отправленного сообщения
     await save_last_message(user_id, sent_message)
 
-    cart_sessions[user_id] = {"product_id": product_id, "product_name": product_name}  # Сохраняем `product_name`
+    await state.set_state(CartStates.update_quantity)
+    await state.set_data({"product_id": product_id, "product_name": product_name})  # Сохраняем `product_name`
 
-@router.message(lambda message: message.text.isdigit() and message.from_user.id in cart_sessions)
-async def confirm_update_handler(message: types.Message):
+@router.message(CartStates.update_quantity, F.text.isdigit())
+async def confirm_update_handler(message: types.Message, state: FSMContext, user_db_id: int | None = None):
     """
     Обновляет количество товара в корзине.
     """
@@ -275,7 +373,7 @@ async def confirm_update_handler(message: types.Message):
     quantity = int(message.text)
 
     # Удаляем ВСЕ предыдущие сообщения с товарами
-    await delete_all_previous_messages(callback_query.message.bot, user_id)
+    await delete_all_previous_messages(message.bot, user_id)
 
     # Объявляем переменную sent_message
     sent_message = None  
@@ -285,19 +383,30 @@ async def confirm_update_handler(message: types.Message):
         await save_last_message(user_id, sent_message)
         return
 
-    product_id = cart_sessions[user_id]["product_id"]
+    product_id = (await state.get_data())["product_id"]
+    await state.clear()
+
+    if not user_db_id:
+        logger.warning("Ошибка! `telegram_id=%s` не найден в `users_botuser`.", user_id)
+        sent_message = await message.answer("❌ Ошибка! Ваш профиль не найден.")
+        await save_last_message(user_id, sent_message)
+        return
 
+    # В `shop_cart.user_id` хранится `users_botuser.id`, а не Telegram ID
     async with async_session_maker() as session:
         update_query = text("""
-        UPDATE shop_cart SET quantity = :quantity WHERE user_id = :user_id AND product_id = :product_id
+        UPDATE shop_cart SET quantity = :quantity WHERE user_id = :user_db_id AND product_id = :product_id
         """)
-        await session.execute(update_query, {"quantity": quantity, "user_id": user_id, "product_id": product_id})
+        result = await session.execute(update_query, {"quantity": quantity, "user_db_id": user_db_id, "product_id": product_id})
         await session.commit()
 
-    sent_message = await message.answer(f"✅ Количество товара обновлено: {quantity} шт.")
+    if result.rowcount:
+        sent_message = await message.answer(f"✅ Количество товара обновлено: {quantity} шт.")
+    else:
+        sent_message = await message.answer("⚠ Этого товара уже нет в корзине.")
 
     # Сохраняем ID последнего отправленного сообщения
     await save_last_message(user_id, sent_message)
 
     # Обновляем корзину после изменения
-    await view_cart_handler(types.CallbackQuery(from_user=message.from_user, message=message))
+    await view_cart_handler(message, user_db_id=user_db_id)
@@ -1,20 +1,20 @@
 import logging
-from aiogram import Router, types
+from aiogram import types
+from helpers.callbacks import callback_router, CategoriesCallback, SubcategoriesCallback
 from helpers.database import get_categories
 from helpers.message_manager import delete_previous_message, save_last_message
-from settings.config import CATEGORIES_PER_PAGE  # Импортируем число категорий на одной странице
+from helpers.pagination import page_navigation
 
 logger = logging.getLogger(__name__)
-router = Router()
 
-@router.callback_query(lambda callback_query: callback_query.data.startswith("category_page_"))
-async def category_handler(callback_query: types.CallbackQuery):
+@callback_router.button(CategoriesCallback)
+async def category_handler(callback_query: types.CallbackQuery, callback_data: CategoriesCallback):
     """
     Обработчик кнопки "📦 Каталог".
     Загружает категории из БД и показывает их с кнопками.
     """
     user_id = callback_query.from_user.id
-    logger.info(f"Обработчик каталога вызван пользователем {user_id}")
+    logger.info("Обработчик каталога вызван пользователем %s", user_id)
 
     # Удаляем предыдущее сообщение, если оно есть
     await delete_previous_message(callback_query.message.bot, user_id)
@@ -22,24 +22,22 @@ async def category_handler(callback_query: types.CallbackQuery):
     # Объявляем переменную sent_message
     sent_message = None  
 
-    page = int(callback_query.data.split("_")[-1])  # Получаем номер страницы
-    logger.info(f"Текущая страница каталога: {page}")
+    page, after, before = callback_data.page, callback_data.after, callback_data.before  # Номер страницы и курсор
+    logger.info("Текущая страница каталога: %s", page)
 
-    offset = (page - 1) * CATEGORIES_PER_PAGE
-    categories = await get_categories(limit=CATEGORIES_PER_PAGE, offset=offset)
-    logger.info(f"Загружено {len(categories)} категорий из БД")
+    categories, has_more = await get_categories(after=after, before=before)
+    logger.info("Загружено %s категорий из БД", len(categories))
     
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-        [types.InlineKeyboardButton(text=category.name, callback_data=f"category_{category.id}")]
+        [types.InlineKeyboardButton(text=category.name, callback_data=SubcategoriesCallback(category_id=category.id).pack())]
         for category in categories
     ])
 
     # Добавляем кнопки "⬅️ Назад" и "➡️ Вперёд"
+    # "➡️ Вперёд" показывается, только если следующая страница действительно не пуста
     navigation_buttons = []
-    if page > 1:
-        navigation_buttons.append(types.InlineKeyboardButton(text="⬅️ Назад", callback_data=f"category_page_{page - 1}"))
-    if len(categories) == CATEGORIES_PER_PAGE:
-        navigation_buttons.append(types.InlineKeyboardButton(text="➡️ Вперёд", callback_data=f"category_page_{page + 1}"))
+    if categories:
+        navigation_buttons, page = page_navigation(callback_data, page, categories, has_more, before)
 
     if navigation_buttons:
         keyboard.inline_keyboard.append(navigation_buttons)
@@ -49,4 +47,4 @@ async def category_handler(callback_query: types.CallbackQuery):
     # Сохраняем ID последнего отправленного сообщения
     await save_last_message(user_id, sent_message)
 
-    logger.info(f"Каталог успешно обновлён для пользователя {user_id}")
+    logger.info("Каталог успешно обновлён для пользователя %s", user_id)
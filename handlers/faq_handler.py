@@ -1,20 +1,53 @@
 import logging
 from aiogram import Router, types
 from aiogram.filters import Command
-from helpers.database import get_questions
+from helpers.callbacks import callback_router, MainMenuCallback, FaqCallback
+from helpers.faq_index import faq_index
 from helpers.message_manager import delete_previous_message, save_last_message
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-@router.callback_query(lambda callback_query: callback_query.data == "faq")
+# Готовые инлайн-результаты по ID вопроса для текущей версии индекса FAQ
+_articles = {}
+_articles_version = None
+
+def get_article(question):
+    """
+    Возвращает инлайн-результат для вопроса, создавая его один раз на версию индекса.
+    """
+    global _articles_version
+
+    if _articles_version != faq_index.version:
+        _articles.clear()
+        _articles_version = faq_index.version
+
+    article = _articles.get(question.id)
+    if article is None:
+        article = types.InlineQueryResultArticle(
+            id=str(question.id),
+            title=question.text,
+            input_message_content=types.InputTextMessageContent(
+                message_text=f"❓ *{question.text}*\n\n{question.answer}",
+                parse_mode="Markdown"
+            ),
+            description=question.answer[:50],  # Показываем превью ответа
+            reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
+                [types.InlineKeyboardButton(text="🔍 Другой вопрос", switch_inline_query_current_chat="")],
+                [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
+            ])
+        )
+        _articles[question.id] = article
+    return article
+
+@callback_router.button(FaqCallback)
 async def faq_handler(callback_query: types.CallbackQuery):
     """
     Обработчик кнопки FAQ.
     Загружает вопросы из БД и показывает их пользователю.
     """
     user_id = callback_query.from_user.id
-    logger.info(f"Обработчик FAQ вызван пользователем {user_id}")
+    logger.info("Обработчик FAQ вызван пользователем %s", user_id)
 
     # Удаляем предыдущее сообщение, если оно есть
     await delete_previous_message(callback_query.message.bot, user_id)
@@ -22,8 +55,9 @@ async def faq_handler(callback_query: types.CallbackQuery):
     # Объявляем переменную sent_message
     sent_message = None  
 
-    questions = await get_questions()
-    logger.info(f"Загружено {len(questions)} вопросов из БД")
+    await faq_index.ensure_fresh()
+    questions = faq_index.questions
+    logger.info("В индексе FAQ %s вопросов", len(questions))
 
     if not questions:
         logger.warning("База данных пустая! Отправляем сообщение о пустом FAQ.")
@@ -37,7 +71,7 @@ async def faq_handler(callback_query: types.CallbackQuery):
     # Сохраняем ID последнего отправленного сообщения
     await save_last_message(user_id, sent_message)
 
-    logger.info(f"Отправлено сообщение с FAQ пользователю {user_id}")
+    logger.info("Отправлено сообщение с FAQ пользователю %s", user_id)
 
 @router.inline_query()
 async def faq_inline_query(query: types.InlineQuery):
@@ -46,37 +80,19 @@ async def faq_inline_query(query: types.InlineQuery):
     Автоматически дополняет вопросы и показывает ответы.
     """
     user_id = query.from_user.id
-    logger.info(f"Получен инлайн-запрос: {query.query} от {query.from_user.id}")
+    logger.info("Получен инлайн-запрос: %s от %s", query.query, query.from_user.id)
 
-    # Удаляем предыдущее сообщение, если оно есть
-    await delete_previous_message(query.bot, user_id)
-
-    user_query = query.query.lower().strip()  # Убираем пробелы и приводим к нижнему регистру
-    questions = await get_questions()
-    logger.info(f"Всего загружено {len(questions)} вопросов из БД")
-
-    # Фильтруем вопросы по пользовательскому запросу
-    results = [
-        types.InlineQueryResultArticle(
-            id=str(q.id),
-            title=q.text,
-            # input_message_content=types.InputTextMessageContent(message_text=f"❓ *{q.text}*\n\n{q.answer}"),
-            input_message_content=types.InputTextMessageContent(
-                message_text=f"❓ *{q.text}*\n\n{q.answer}",
-                parse_mode="Markdown"
-            ),
-            description=q.answer[:50],  # Показываем превью ответа
-            reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
-                [types.InlineKeyboardButton(text="🔍 Другой вопрос", switch_inline_query_current_chat="")],
-                [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")]
-            ])
-        )
-        for q in questions if user_query in q.text.lower() or q.text.lower().startswith(user_query)
-    ]
+    # Удаляем предыдущее сообщение только при открытии FAQ (пустой запрос), а не на каждый введённый символ
+    if not query.query:
+        await delete_previous_message(query.bot, user_id)
+
+    # Ищем вопросы по индексу в памяти, без обращения к БД
+    await faq_index.ensure_fresh()
+    results = [get_article(q) for q in faq_index.search(query.query)]
 
     await query.answer(results, cache_time=0)
 
-    logger.info(f"Инлайн-ответ отправлен пользователю {user_id}")
+    logger.info("Инлайн-ответ отправлен пользователю %s", user_id)
 
 @router.message(Command("faq"))
 async def faq_command_handler(message: types.Message):
@@ -1,40 +1,30 @@
 import asyncio
 import logging
-import openpyxl
-import os
+import aiohttp
 import uuid
 from aiogram import Router, types
-from yookassa import Configuration, Payment
-from helpers.database import async_session_maker
+from aiogram.exceptions import TelegramAPIError
+from aiogram.fsm.context import FSMContext
+from helpers.callbacks import callback_router, MainMenuCallback, CheckoutCallback
+from helpers.database import async_session_maker, create_order, cancel_order
 from helpers.message_manager import delete_previous_message
+from helpers.order_export import order_exporter
+from helpers.payments import create_payment, register_pending_payment
+from helpers.send_scheduler import background_sends
+from helpers.states import OrderStates
+from helpers.yookassa_gateway import YooKassaError
 from sqlalchemy.sql import text
-from dotenv import load_dotenv
-
-# Загружаем `.env`
-load_dotenv()
-
-# Подключаем Юкассу
-YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID")
-YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY")
-YOOKASSA_RETURN_URL = os.getenv("YOOKASSA_RETURN_URL")
-
-# Настраиваем авторизацию Юкасса
-Configuration.account_id = YOOKASSA_SHOP_ID
-Configuration.secret_key = YOOKASSA_SECRET_KEY
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-# Сохраняем данные о текущем заказе пользователя
-order_sessions = {}
-
-@router.callback_query(lambda callback_query: callback_query.data == "checkout")
-async def ask_delivery_info_handler(callback_query: types.CallbackQuery):
+@callback_router.button(CheckoutCallback)
+async def ask_delivery_info_handler(callback_query: types.CallbackQuery, state: FSMContext):
     """
     Запрашивает у пользователя данные для доставки заказа.
     """
     user_id = callback_query.from_user.id
-    logger.info(f"Пользователь `{user_id}` начал оформление заказа!")
+    logger.info("Пользователь `%s` начал оформление заказа!", user_id)
 
     # Удаляем предыдущее сообщение перед запросом доставки
     await delete_previous_message(callback_query.message.bot, user_id)
@@ -42,120 +32,119 @@ async def ask_delivery_info_handler(callback_query: types.CallbackQuery):
     sent_message = await callback_query.message.answer("Введи данные для доставки (адрес, телефон и др.) 👇")
 
     # Запоминаем сообщение с запросом доставки для последующего удаления
-    order_sessions[user_id] = {"message_id": sent_message.message_id}
-    logger.info(f"Сохранён ID сообщения `{sent_message.message_id}` для запроса данных доставки пользователя `{user_id}`.")
+    await state.set_state(OrderStates.delivery_info)
+    await state.set_data({"message_id": sent_message.message_id})
+    logger.info("Сохранён ID сообщения `%s` для запроса данных доставки пользователя `%s`.", sent_message.message_id, user_id)
 
-@router.message(lambda message: message.from_user.id in order_sessions)
-async def confirm_order_handler(message: types.Message):
+@router.message(OrderStates.delivery_info)
+async def confirm_order_handler(message: types.Message, state: FSMContext, user_db_id: int | None = None):
     """
     Создаёт заказ и отправляет ссылку для оплаты в Юкасса.
     """
     user_id = message.from_user.id
     delivery_info = message.text
-    logger.info(f"Получены данные доставки от `{user_id}`: {delivery_info}")
-
-    async with async_session_maker() as session:
-        # Получаем `id` пользователя
-        user_query = text("SELECT id FROM users_botuser WHERE telegram_id = :user_id")
-        result = await session.execute(user_query, {"user_id": user_id})
-        user_db_id = result.scalar()
-
-        if not user_db_id:
-            logger.warning(f"❌ Ошибка! `telegram_id={user_id}` не найден в `users_botuser`.")
-            await message.answer("❌ Ошибка! Ваш профиль не найден.")
-            return
-
-        # Создаём новый заказ
-        create_order_query = text("""
-        INSERT INTO shop_order (user_id, created_at, delivery_info)
-        VALUES (:user_db_id, NOW(), :delivery_info)
-        RETURNING id
-        """)
-        result = await session.execute(create_order_query, {"user_db_id": user_db_id, "delivery_info": delivery_info})
-        order_id = result.scalar()
-        await session.commit()
-
-        logger.info(f"✅ Заказ `{order_id}` успешно создан для пользователя `{user_id}`.")
-
-        # Добавляем товары в заказ
-        cart_query = text("SELECT product_id, quantity FROM shop_cart WHERE user_id = :user_db_id")
-        result = await session.execute(cart_query, {"user_db_id": user_db_id})
-        cart_items = result.fetchall()
+    logger.info("Получены данные доставки от `%s`: %s", user_id, delivery_info)
 
-        total_amount = 0.0
-        for product_id, quantity in cart_items:
-            product_query = text("SELECT price FROM shop_product WHERE id = :product_id")
-            result = await session.execute(product_query, {"product_id": product_id})
-            product_price = result.scalar()
+    if not user_db_id:
+        logger.warning("❌ Ошибка! `telegram_id=%s` не найден в `users_botuser`.", user_id)
+        await state.clear()
+        await message.answer("❌ Ошибка! Ваш профиль не найден.")
+        return
 
-            add_order_item_query = text("""
-            INSERT INTO shop_orderitem (order_id, product_id, quantity)
-            VALUES (:order_id, :product_id, :quantity)
-            """)
-            await session.execute(add_order_item_query, {"order_id": order_id, "product_id": product_id, "quantity": quantity})
-            
-            total_amount += float(product_price) * quantity
+    # Создаём заказ из корзины и очищаем корзину одним запросом
+    order = await create_order(user_db_id, delivery_info)
+    if order is None:
+        logger.warning("Корзина пользователя `%s` пуста, заказ не создан.", user_id)
+        await state.clear()
+        await message.answer("🛒 Ваша корзина пуста!")
+        return
 
-        await session.commit()
-        logger.info(f"Все товары из корзины добавлены в заказ `{order_id}`.")
-
-        # Очищаем корзину пользователя
-        await session.execute(text("DELETE FROM shop_cart WHERE user_id = :user_db_id"), {"user_db_id": user_db_id})
-        await session.commit()
-        logger.info(f"Корзина пользователя `{user_id}` успешно очищена!")
+    order_id, total_amount = order
+    logger.info("✅ Заказ `%s` успешно создан для пользователя `%s`.", order_id, user_id)
 
     # Удаляем предыдущее сообщение с запросом доставки
     await delete_previous_message(message.bot, user_id)
-    logger.info(f"Сообщение запроса доставки пользователя `{user_id}` удалено.")
+    logger.info("Сообщение запроса доставки пользователя `%s` удалено.", user_id)
 
     # Генерируем уникальный `idempotence_key` для Юкасса
     idempotence_key = str(uuid.uuid4())
 
-    # Создаём платёж через Юкасса
-    payment = Payment.create({
-        "amount": {"value": f"{total_amount:.2f}", "currency": "RUB"},
-        "confirmation": {"type": "redirect", "return_url": YOOKASSA_RETURN_URL},
-        "capture": True,
-        "description": f"Оплата заказа №{order_id}"
-    }, idempotence_key)  # Передаём `idempotence_key`
-
-    payment_id = payment.id # Сохраняем ID платежа
-    payment_url = payment.confirmation.confirmation_url
-    logger.info(f"Сгенерирована ссылка для оплаты заказа `{order_id}`: {payment_url}")
+    # Создаём платёж через Юкасса (повторные попытки используют тот же `idempotence_key`)
+    try:
+        payment_id, payment_url = await create_payment(total_amount, f"Оплата заказа №{order_id}", idempotence_key)
+    except Exception as e:
+        if isinstance(e, (YooKassaError, aiohttp.ClientError, asyncio.TimeoutError)):
+            logger.error("Не удалось создать платёж для заказа `%s`: %s", order_id, e)
+        else:
+            logger.exception("Непредвиденная ошибка при создании платежа для заказа `%s`", order_id)
+
+        # Без платежа заказ оплатить нельзя: возвращаем товары в корзину, чтобы можно было оформить заново
+        await cancel_order(order_id, user_db_id)
+        await state.clear()
+        await message.answer("❌ Не удалось создать платёж, попробуй позже. Товары остались в корзине.")
+        return
+
+    logger.info("Сгенерирована ссылка для оплаты заказа `%s`: %s", order_id, payment_url)
+
+    # Ставим платёж на отслеживание до отправки ссылки: оплату по отправленной ссылке нельзя потерять
+    try:
+        await register_pending_payment(payment_id, order_id, user_db_id, user_id, total_amount)
+    except Exception:
+        logger.exception("Не удалось поставить на отслеживание платёж `%s` заказа `%s`", payment_id, order_id)
+        # Ссылку пользователь не получил, поэтому заказ безопасно отменить
+        await cancel_order(order_id, user_db_id)
+        await state.clear()
+        await message.answer("❌ Не удалось создать платёж, попробуй позже. Товары остались в корзине.")
+        return
 
     # Клавиатура с кнопкой "🏠 Главное меню"
     menu_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
         [types.InlineKeyboardButton(text="💳 Оплатить заказ", url=payment_url)],
-        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")]
+        [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
     ])
 
     # Подтверждение заказа
     sent_message = await message.answer("✅ Заказ принят, произведи оплату!", reply_markup=menu_keyboard)
-    logger.info(f"Сохранён ID сообщения `{sent_message.message_id}` для подтверждения заказа пользователя `{user_id}`.")
-
-    # Удаляем данные из `order_sessions`
-    del order_sessions[user_id]
-    logger.info(f"`order_sessions[{user_id}]` Данные `order_sessions` удалены успешно!")
+    logger.info("Сохранён ID сообщения `%s` для подтверждения заказа пользователя `%s`.", sent_message.message_id, user_id)
 
-    # Запускаем проверку статуса платежа
-    await check_payment_status(message.bot, payment_id, user_id, total_amount)
+    # Завершаем диалог оформления заказа
+    await state.clear()
+    logger.info("Состояние оформления заказа пользователя `%s` сброшено.", user_id)
 
-async def check_payment_status(bot, payment_id, user_id, total_amount):
+async def handle_paid_order(bot, payment):
     """
-    Проверяет статус платежа и отправляет сообщение пользователю после успешной оплаты.
+    Передаёт оплаченный заказ в выгрузку и отправляет пользователю подтверждение оплаты.
+    Сверка платежей повторяет вызов, пока он не завершится без исключения, поэтому заказ
+    выгружается до уведомления, а ошибка отправки (например, бот заблокирован) не прерывает обработку.
     """
-    while True:
-        payment = Payment.find_one(payment_id)  # Получаем статус платежа
-        if payment.status == "succeeded":
-            logger.info(f"Оплата заказа `{payment_id}` успешно завершена для пользователя `{user_id}`.")
+    user_id = payment.telegram_id
+
+    async with async_session_maker() as session:
+        order_query = text("SELECT id, delivery_info FROM shop_order WHERE id = :order_id")
+        result = await session.execute(order_query, {"order_id": payment.order_id})
+        order = result.fetchone()
+
+        if order is None:
+            logger.warning("Ошибка! Заказ `%s` не найден в `shop_order`.", payment.order_id)
+            return
 
+        cart_query = text("SELECT shop_product.name, shop_orderitem.quantity FROM shop_orderitem JOIN shop_product ON shop_orderitem.product_id = shop_product.id WHERE shop_orderitem.order_id = :order_id")
+        result = await session.execute(cart_query, {"order_id": order.id})
+        cart_items = result.fetchall()
+
+    # Записываем заказ в журнал (Excel пересобирает фоновый поток)
+    await asyncio.to_thread(order_exporter.export, order.id, payment.user_id, payment.amount, order.delivery_info, cart_items)
+
+    try:
+        # Уведомления об оплате пропускают вперёд ответы пользователям на их действия
+        with background_sends():
             # Удаляем предыдущее сообщение
             await delete_previous_message(bot, user_id)
-            logger.info(f"Удалено предыдущее сообщение перед отправкой подтверждения оплаты пользователю `{user_id}`.")
+            logger.info("Удалено предыдущее сообщение перед отправкой подтверждения оплаты пользователю `%s`.", user_id)
 
             # Кнопка "🏠 Главное меню"
             menu_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-                [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")]
+                [types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())]
             ])
 
             # Отправляем пользователю сообщение о подтверждении заказа
@@ -164,60 +153,7 @@ async def check_payment_status(bot, payment_id, user_id, total_amount):
                 text="✅ Заказ успешно оплачен, ожидай доставки!",
                 reply_markup=menu_keyboard
             )
-            logger.info(f"Отправлено подтверждение оплаты пользователю `{user_id}`.")
-
-            # Получаем `user_db_id` по Telegram ID
-            async with async_session_maker() as session:
-                user_query = text("SELECT id FROM users_botuser WHERE telegram_id = :telegram_id")
-                result = await session.execute(user_query, {"telegram_id": user_id})
-                user_db_id = result.scalar()
-
-                if not user_db_id:
-                    logger.warning(f"Ошибка! `telegram_id={user_id}` не найден в `users_botuser`.")
-                    return
-
-                # Теперь ищем заказ по `user_db_id`
-                order_query = text("SELECT id, delivery_info FROM shop_order WHERE user_id = :user_db_id ORDER BY created_at DESC LIMIT 1")
-                result = await session.execute(order_query, {"user_db_id": user_db_id})
-                order = result.fetchone()
-
-                if order is None:
-                    logger.warning(f"Ошибка! Заказ пользователя `{user_db_id}` не найден в `shop_order`.")
-                    return
-                
-                cart_query = text("SELECT shop_product.name, shop_orderitem.quantity FROM shop_orderitem JOIN shop_product ON shop_orderitem.product_id = shop_product.id WHERE shop_orderitem.order_id = :order_id")
-                result = await session.execute(cart_query, {"order_id": order.id})
-                cart_items = result.fetchall()
-
-            # Сохраняем заказ в Excel
-            save_order_to_excel(order.id, user_db_id, total_amount, order.delivery_info, cart_items)
-            logger.info(f"Заказ `{order.id}` сохранён в Excel.")
-
-            break  # Останавливаем проверку после успешной оплаты
-
-        await asyncio.sleep(10)  # Проверяем статус каждые 10 секунд
-
-def save_order_to_excel(order_id, user_id, total_amount, delivery_info, cart_items):
-    """
-    Сохраняет информацию о заказе в Excel-файл в папке 'orders'.
-    """
-    folder_path = "orders"
-    file_path = os.path.join(folder_path, "orders.xlsx")
-
-    # Проверяем, существует ли папка, если нет — создаём
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    try:
-        wb = openpyxl.load_workbook(file_path)
-        sheet = wb.active
-    except FileNotFoundError:
-        wb = openpyxl.Workbook()
-        sheet = wb.active
-        sheet.append(["Заказ №", "Пользователь", "Сумма", "Доставка", "Товары"])
-
-    items_str = ", ".join([f"{product_name} (x{quantity})" for product_name, quantity in cart_items])
-    sheet.append([order_id, user_id, f"{total_amount:.2f} ₽", delivery_info, items_str])
-    
-    wb.save(file_path)
-    logger.info(f"Заказ `{order_id}` сохранён в `{file_path}`.")
+    except TelegramAPIError as e:
+        logger.warning("Не удалось отправить подтверждение оплаты заказа `%s` пользователю `%s`: %s", order.id, user_id, e)
+        return
+    logger.info("Отправлено подтверждение оплаты пользователю `%s`.", user_id)
@@ -1,41 +1,100 @@
 import logging
-from aiogram import Router, types
-from sqlalchemy.future import select
-from sqlalchemy.sql import func
+from aiogram import types
+from helpers.callbacks import callback_router, MainMenuCallback, ProductsCallback, AddToCartCallback
 from helpers.database import get_products
+from helpers.media_cache import send_product_photo, send_product_album
 from helpers.message_manager import delete_previous_message, delete_all_previous_messages, save_last_message
-from helpers.database import async_session_maker
-from settings.config import PRODUCTS_PER_PAGE
-from helpers.models import Product
+from helpers.pagination import page_navigation
+from settings.config import PRODUCTS_PER_PAGE, PRODUCT_RENDER_MODE
 
 logger = logging.getLogger(__name__)
-router = Router()
 
-@router.callback_query(lambda callback_query: callback_query.data.startswith("subcategory_") or callback_query.data.startswith("product_page_"))
-async def product_handler(callback_query: types.CallbackQuery):
+MAX_CAPTION_LENGTH = 1024  # Ограничение Telegram на длину подписи к фото
+MAX_ALBUM_SIZE = 10  # Максимальное число фото в одном альбоме
+
+def product_caption(product, number=None):
+    """
+    Формирует подпись к фото товара. Слишком длинное описание обрезается до лимита Telegram.
+    """
+    title = f"{number}. *{product.name}*" if number else f"*{product.name}*"
+    price = f"Цена: {product.price} ₽"
+    caption = f"{title}\n\n{product.description}\n\n{price}"
+    if len(caption) > MAX_CAPTION_LENGTH:
+        description_length = MAX_CAPTION_LENGTH - len(title) - len(price) - 5
+        caption = f"{title}\n\n{product.description[:description_length]}…\n\n{price}"
+    return caption
+
+async def send_products_as_cards(callback_query, user_id, products):
+    """
+    Отправляет каждый товар отдельным фото с кнопкой «В корзину».
+    """
+    for product in products:
+        logger.info("Проверяем товар: %s, цена: %s, изображение: %s", product.name, product.price, product.image)
+
+        product_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[])
+        btn = types.InlineKeyboardButton(text=f"🛒 В корзину ({product.price} ₽)", callback_data=AddToCartCallback(product_id=product.id).pack())
+        product_keyboard.inline_keyboard.append([btn])
+
+        logger.info("Добавлена кнопка: %s", btn.text)
+
+        sent_message = await send_product_photo(
+            callback_query.message.answer_photo, product.id, product.image,
+            caption=product_caption(product),
+            reply_markup=product_keyboard,
+            parse_mode="Markdown"
+        )
+
+        await save_last_message(user_id, sent_message)  # Сохраняем ID каждого сообщения
+
+async def send_products_as_album(callback_query, user_id, products):
+    """
+    Отправляет товары страницы одним альбомом с пронумерованными подписями.
+    Возвращает кнопки «В корзину» с теми же номерами для сообщения с навигацией.
+    """
+    numbered = list(enumerate(products, start=1))
+    for start in range(0, len(numbered), MAX_ALBUM_SIZE):
+        chunk = numbered[start:start + MAX_ALBUM_SIZE]
+        if len(chunk) == 1:
+            # Альбом должен содержать не меньше двух фото
+            number, product = chunk[0]
+            sent_messages = [await send_product_photo(
+                callback_query.message.answer_photo, product.id, product.image,
+                caption=product_caption(product, number), parse_mode="Markdown"
+            )]
+        else:
+            sent_messages = await send_product_album(
+                callback_query.message.answer_media_group,
+                [(product.id, product.image, product_caption(product, number)) for number, product in chunk]
+            )
+
+        for sent_message in sent_messages:
+            await save_last_message(user_id, sent_message)
+
+    return [
+        [types.InlineKeyboardButton(text=f"🛒 {number}. {product.name} ({product.price} ₽)", callback_data=AddToCartCallback(product_id=product.id).pack())]
+        for number, product in numbered
+    ]
+
+@callback_router.button(ProductsCallback)
+async def product_handler(callback_query: types.CallbackQuery, callback_data: ProductsCallback):
     user_id = callback_query.from_user.id
 
-    if callback_query.data.startswith("subcategory_"):
-        subcategory_id = int(callback_query.data.split("_")[-1])
-        page = 1
-    else:
-        subcategory_id, page = map(int, callback_query.data.split("_")[2:])
+    # Кнопка подкатегории открывает первую страницу; при листании `after` — товары после указанного, `before` — перед ним
+    subcategory_id = callback_data.subcategory_id
+    page, after, before = callback_data.page, callback_data.after, callback_data.before
 
-    logger.info(f"Пользователь {user_id} запросил товары для подкатегории {subcategory_id}, страница {page}")
+    logger.info("Пользователь %s запросил товары для подкатегории %s, страница %s", user_id, subcategory_id, page)
 
     # Удаляем ВСЕ предыдущие сообщения
     await delete_all_previous_messages(callback_query.message.bot, user_id)
 
-    # Получаем общее количество товаров в подкатегории
-    total_products = await count_products_in_subcategory(subcategory_id)
-    logger.info(f"В подкатегории {subcategory_id} всего товаров: {total_products}")
-
-    # Загружаем товары для текущей страницы
-    products = await get_products(subcategory_id, page)
+    # Загружаем товары для текущей страницы вместе с общим количеством товаров одним запросом
+    products, has_more, total_products = await get_products(subcategory_id, after=after, before=before)
+    logger.info("В подкатегории %s всего товаров: %s", subcategory_id, total_products)
 
     # Если товаров нет в подкатегории
     if not products:
-        logger.warning(f"❌ В подкатегории {subcategory_id} нет товаров. Показываем кнопку '🏠 Главное меню'.")
+        logger.warning("❌ В подкатегории %s нет товаров. Показываем кнопку '🏠 Главное меню'.", subcategory_id)
 
         # Удаляем предыдущее сообщение, если оно есть
         await delete_previous_message(callback_query.message.bot, user_id)
@@ -45,11 +104,11 @@ async def product_handler(callback_query: types.CallbackQuery):
 
         # Создаём клавиатуру
         main_menu_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[])
-        main_menu_button = types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="start")
+        main_menu_button = types.InlineKeyboardButton(text="🏠 Главное меню", callback_data=MainMenuCallback().pack())
 
         main_menu_keyboard.inline_keyboard.append([main_menu_button])  # Добавляем кнопку
 
-        logger.info(f"Отправляем кнопку '🏠 Главное меню' пользователю {user_id}")
+        logger.info("Отправляем кнопку '🏠 Главное меню' пользователю %s", user_id)
 
         sent_message = await callback_query.message.answer("❌ Нет товаров в этой подкатегории.", reply_markup=main_menu_keyboard)
         
@@ -58,51 +117,28 @@ async def product_handler(callback_query: types.CallbackQuery):
         
         return
 
-    # Отправляем товары по одному
-    for product in products:
-        logger.info(f"Проверяем товар: {product.name}, цена: {product.price}, изображение: {product.image}")
-
-        product_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[])
-        btn = types.InlineKeyboardButton(text=f"🛒 В корзину ({product.price} ₽)", callback_data=f"add_to_cart_{product.id}")
-        product_keyboard.inline_keyboard.append([btn])
-
-        logger.info(f"Добавлена кнопка: {btn.text}")
-
-        sent_message = await callback_query.message.answer_photo(
-            photo=product.image,
-            caption=f"*{product.name}*\n\n{product.description}\n\nЦена: {product.price} ₽",
-            reply_markup=product_keyboard,
-            parse_mode="Markdown"
-        )
-
-        await save_last_message(user_id, sent_message)  # Сохраняем ID каждого сообщения
+    if PRODUCT_RENDER_MODE == "album":
+        # Вся страница — альбом и одно сообщение с кнопками «В корзину» и навигацией
+        cart_buttons = await send_products_as_album(callback_query, user_id, products)
+    else:
+        # Отправляем товары по одному
+        await send_products_as_cards(callback_query, user_id, products)
+        cart_buttons = []
 
     # Добавляем навигацию "➡️ Вперёд", если есть еще товары
-    navigation_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[])
-    
-    if page > 1:
-        navigation_keyboard.inline_keyboard.append([types.InlineKeyboardButton(text="⬅️ Назад", callback_data=f"product_page_{subcategory_id}_{page - 1}")])
-    
-    next_page_start = page * PRODUCTS_PER_PAGE
-    if next_page_start < total_products:  # Проверяем, останутся ли ещё товары!
-        navigation_keyboard.inline_keyboard.append([types.InlineKeyboardButton(text="➡️ Вперёд", callback_data=f"product_page_{subcategory_id}_{page + 1}")])
+    navigation_keyboard = types.InlineKeyboardMarkup(inline_keyboard=cart_buttons)
+
+    navigation_buttons, page = page_navigation(callback_data, page, products, has_more, before)
+    for button in navigation_buttons:
+        navigation_keyboard.inline_keyboard.append([button])
 
     # Вычисляем количество страниц
     total_pages = (total_products + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
     navigation_text = f"Всего товаров в подкатегории: {total_products}\nСтраница {page} из {total_pages}"
 
     if navigation_keyboard.inline_keyboard:
-        logger.info(f"Добавлены кнопки навигации.")
+        logger.info("Добавлены кнопки навигации.")
         sent_message = await callback_query.message.answer(navigation_text, reply_markup=navigation_keyboard)
         await save_last_message(user_id, sent_message)  # Сохраняем навигацию
 
-    logger.info(f"Все товары успешно загружены для пользователя {user_id}")
-
-async def count_products_in_subcategory(subcategory_id):
-    """Возвращает общее количество товаров в подкатегории."""
-    from helpers.database import async_session_maker
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(func.count()).select_from(Product).where(Product.subcategory_id == subcategory_id)
-        )
-        return result.scalar()
+    logger.info("Все товары успешно загружены для пользователя %s", user_id)
@@ -1,12 +1,17 @@
+import logging
 from aiogram import Router, types
 from aiogram.filters import Command
 from handlers.cart_handler import view_cart_handler
+from helpers.callbacks import callback_router, MainMenuCallback, CategoriesCallback, CartCallback
 from helpers.database import save_user
 from helpers.utils import check_subscription
 from helpers.message_manager import delete_previous_message, save_last_message
 from settings.config import TG_CHANNEL_URL, TG_GROUP_URL
 
+logger = logging.getLogger(__name__)
 router = Router()
+# Подключается последним: ловит кнопки, которые не подошли ни к одному обработчику
+stale_buttons_router = Router(name="stale_buttons")
 
 @router.message(Command("start"))
 async def start_message_handler(message: types.Message):
@@ -17,12 +22,13 @@ async def start_message_handler(message: types.Message):
     user_id = message.from_user.id
     first_name = message.from_user.first_name
 
-    # Сохраняем пользователя при первом запуске
+    # Сохраняем пользователя или обновляем его профиль (повторный /start без изменений в БД не ходит)
     await save_user(message.from_user)
 
-    await send_main_menu(message.bot, user_id, first_name)
+    # После /start пользователь мог только что подписаться, поэтому отрицательный результат перепроверяем
+    await send_main_menu(message.bot, user_id, first_name, recheck_subscription=True)
 
-@router.callback_query(lambda callback_query: callback_query.data == "start")
+@callback_router.button(MainMenuCallback)
 async def start_callback_handler(callback_query: types.CallbackQuery):
     """
     Обработчик callback-кнопки "🏠 Главное меню".
@@ -48,16 +54,16 @@ async def start_callback_handler(callback_query: types.CallbackQuery):
         # Если `callback_query.message` нет (из инлайн-режима), просто отправляем главное меню
         await send_main_menu(callback_query.bot, user_id, first_name)
 
-async def send_main_menu(bot, user_id, first_name):
+async def send_main_menu(bot, user_id, first_name, recheck_subscription=False):
     """
     Отправляет главное меню пользователю.
     """
     await delete_previous_message(bot, user_id)
 
-    is_subscribed = await check_subscription(user_id)
+    is_subscribed = await check_subscription(bot, user_id, recheck_negative=recheck_subscription)
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-        [types.InlineKeyboardButton(text="📦 Каталог", callback_data="category_page_1")],
-        [types.InlineKeyboardButton(text="🛒 Корзина", callback_data="view_cart")],
+        [types.InlineKeyboardButton(text="📦 Каталог", callback_data=CategoriesCallback().pack())],
+        [types.InlineKeyboardButton(text="🛒 Корзина", callback_data=CartCallback().pack())],
         [types.InlineKeyboardButton(text="❓ FAQ", switch_inline_query_current_chat="")]
     ])
 
@@ -76,10 +82,19 @@ async def send_main_menu(bot, user_id, first_name):
 
     await save_last_message(user_id, sent_message)
 
+@stale_buttons_router.callback_query()
+async def stale_button_handler(callback_query: types.CallbackQuery):
+    """
+    Кнопки, данные которых не подходят ни к одной фабрике (например, под сообщениями,
+    отправленными до смены формата `callback_data`), предлагают заново открыть меню.
+    """
+    logger.info("Устаревшая кнопка `%s` от пользователя %s", callback_query.data, callback_query.from_user.id)
+    await callback_query.answer("Меню обновилось, открой его заново: /start", show_alert=True)
+
 @router.message(Command("cart"))
-async def cart_command_handler(message: types.Message):
+async def cart_command_handler(message: types.Message, user_db_id: int | None = None):
     """
     Показывает корзину при вводе команды `/cart`.
     """
     user_id = message.from_user.id  # Получаем user_id
-    await view_cart_handler(message, user_id)  # Передаём user_id в `view_cart_handler`
+    await view_cart_handler(message, user_id, user_db_id=user_db_id)  # Передаём user_id в `view_cart_handler`
@@ -0,0 +1,139 @@
+import inspect
+from typing import Optional
+
+from aiogram import Router, types
+from aiogram.filters.callback_data import CallbackData
+
+# Фабрики `callback_data` кнопок бота. Префиксы короткие, чтобы в лимит Telegram 64 байта
+# помещались ID и курсоры постраничного вывода: например, `p:12:3:481:` — товары подкатегории 12,
+# страница 3 после товара 481. Префиксы не должны повторяться.
+
+SEPARATOR = ":"  # Разделитель полей `callback_data` (по умолчанию в aiogram)
+
+
+class MainMenuCallback(CallbackData, prefix="m"):
+    """🏠 Главное меню"""
+
+
+class CategoriesCallback(CallbackData, prefix="c"):
+    """📦 Каталог: страница категорий. `after`/`before` — ID крайней категории соседней страницы."""
+    page: int = 1
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+
+class SubcategoriesCallback(CallbackData, prefix="s"):
+    """Подкатегории категории `category_id` (кнопка категории и листание)."""
+    category_id: int
+    page: int = 1
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+
+class ProductsCallback(CallbackData, prefix="p"):
+    """Товары подкатегории `subcategory_id` (кнопка подкатегории и листание)."""
+    subcategory_id: int
+    page: int = 1
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+
+class AddToCartCallback(CallbackData, prefix="a"):
+    """🛒 В корзину: запрос количества товара."""
+    product_id: int
+
+
+class ConfirmCartCallback(CallbackData, prefix="ac"):
+    """✅ Подтверждение добавления в корзину."""
+
+
+class CartCallback(CallbackData, prefix="v"):
+    """🛒 Корзина."""
+
+
+class CartPageCallback(CallbackData, prefix="cp"):
+    """Листание компактной корзины (сообщение меняется на месте)."""
+    page: int
+
+
+class CartLineCallback(CallbackData, prefix="cl"):
+    """Кнопки позиции компактной корзины: `action` — "i" (➕), "d" (➖) или "r" (❌), `page` — текущая страница."""
+    product_id: int
+    action: str
+    page: int = 1
+
+
+class RemoveFromCartCallback(CallbackData, prefix="cr"):
+    """❌ Удаление товара из корзины."""
+    product_id: int
+
+
+class UpdateCartCallback(CallbackData, prefix="cu"):
+    """✏ Изменение количества товара в корзине."""
+    product_id: int
+
+
+class CheckoutCallback(CallbackData, prefix="o"):
+    """📦 Оформление заказа."""
+
+
+class FaqCallback(CallbackData, prefix="f"):
+    """❓ FAQ."""
+
+
+class CallbackRouter(Router):
+    """
+    Роутер кнопок с таблицей "префикс `CallbackData` -> (фабрика, обработчик)".
+    В aiogram зарегистрирован один обработчик callback-запросов: он берёт префикс из `callback_data`
+    и находит кнопку в словаре, поэтому выбор не зависит от числа кнопок и порядка регистрации.
+    Данные, которые не подошли ни к одной кнопке, передаются следующим роутерам.
+    """
+
+    def __init__(self, *, name=None):
+        super().__init__(name=name)
+        self.buttons = {}  # префикс -> (фабрика, обработчик, имена принимаемых аргументов или None — все)
+        self.callback_query.register(self._dispatch, self._match)
+
+    def button(self, factory):
+        """
+        Декоратор обработчика кнопки: `@callback_router.button(CartCallback)`.
+        Обработчик получает `callback_data` (экземпляр фабрики) и те же аргументы, что и обычный обработчик aiogram.
+        """
+        if factory.__separator__ != SEPARATOR:
+            raise ValueError(f"{factory.__name__}: таблица префиксов поддерживает только разделитель {SEPARATOR!r}")
+        known = self.buttons.get(factory.__prefix__)
+        if known is not None:
+            raise ValueError(f"Префикс {factory.__prefix__!r} уже занят {known[0].__name__}, {factory.__name__} нужен другой")
+
+        def decorator(callback):
+            parameters = inspect.signature(callback).parameters.values()
+            if any(parameter.kind is inspect.Parameter.VAR_KEYWORD for parameter in parameters):
+                accepted = None
+            else:
+                accepted = {parameter.name for parameter in parameters}
+            self.buttons[factory.__prefix__] = (factory, callback, accepted)
+            return callback
+
+        return decorator
+
+    async def _match(self, callback_query: types.CallbackQuery):
+        """Фильтр: находит кнопку по префиксу и разбирает её данные."""
+        data = callback_query.data or ""
+        button = self.buttons.get(data.split(SEPARATOR, 1)[0])
+        if button is None:
+            return False
+        try:
+            callback_data = button[0].unpack(data)
+        except (TypeError, ValueError):
+            return False  # Данные старого формата с тем же префиксом
+        return {"callback_data": callback_data, "button": button}
+
+    async def _dispatch(self, callback_query: types.CallbackQuery, button, **kwargs):
+        _, callback, accepted = button
+        if accepted is not None:
+            kwargs = {key: value for key, value in kwargs.items() if key in accepted}
+        return await callback(callback_query, **kwargs)
+
+
+# Общий роутер кнопок всех разделов бота
+callback_router = CallbackRouter(name="callbacks")
@@ -1,11 +1,21 @@
 import os
+import time
+import asyncio
 import logging
+from collections import OrderedDict
 from datetime import datetime
+import asyncpg
+from greenlet import getcurrent
 from dotenv import load_dotenv
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.future import select
-from sqlalchemy.sql import text
+from sqlalchemy.sql import text, func
+from settings.config import (
+    CATALOG_CACHE_MAX_SIZE, CATALOG_CACHE_TTL, USER_ID_CACHE_SIZE, USER_ID_CACHE_TTL, USER_ID_NEGATIVE_TTL, SEEN_USER_CACHE_SIZE, SEEN_USER_CACHE_TTL,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +23,97 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Настройка пула соединений и драйвера (переопределяются в `.env`)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # Постоянных соединений в пуле
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Временных соединений сверх пула в пиковой нагрузке
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Сколько секунд ждать свободного соединения
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Проверять соединение перед выдачей из пула
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Пересоздавать соединения старше N секунд (-1 — никогда)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # Кэш подготовленных запросов asyncpg (0 за pgbouncer в режиме transaction)
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "30000"))  # statement_timeout в миллисекундах (0 — без ограничения)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"  # Писать в лог все SQL-запросы
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который замеряет ожидание свободного соединения.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = {
+            "checkouts": 0, "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0,
+            "connects": 0, "connect_seconds": 0.0,
+        }
+        self._connecting = {}  # greenlet -> время открытия соединений внутри текущей выдачи
+
+    def _do_get(self):
+        started = time.perf_counter()
+        self._connecting[getcurrent()] = 0.0
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.metrics["timeouts"] += 1
+            raise
+        finally:
+            # Открытие нового соединения — это не ожидание свободного, его время считается отдельно
+            waited = time.perf_counter() - started - self._connecting.pop(getcurrent(), 0.0)
+            self.metrics["checkouts"] += 1
+            if waited > 0.001:
+                self.metrics["waited"] += 1
+                self.metrics["wait_seconds"] += waited
+                self.metrics["max_wait_seconds"] = max(self.metrics["max_wait_seconds"], waited)
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            elapsed = time.perf_counter() - started
+            current = getcurrent()
+            if current in self._connecting:
+                self._connecting[current] += elapsed
+            self.metrics["connects"] += 1
+            self.metrics["connect_seconds"] += elapsed
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
 # Создаём движок PostgreSQL в асинхронном режиме
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
+engine = create_async_engine(
+    DATABASE_URL,
+    future=True,
+    echo=DB_ECHO,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args={
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,  # Кэш SQLAlchemy поверх asyncpg
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,  # Собственный кэш asyncpg
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)},
+    },
+)
+
+def get_pool_metrics():
+    """
+    Возвращает состояние пула соединений: выданные и свободные соединения, переполнение
+    и статистику ожидания свободного соединения.
+    """
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        **pool.metrics,
+    }
 
 # Создаём фабрику сессий
 async_session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
@@ -23,33 +122,316 @@ async_session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
 class Base(DeclarativeBase):
     pass
 
-async def save_user(user):
+
+async def init_bot_tables():
+    """
+    Создаёт таблицы, которыми владеет бот (в отличие от таблиц Django), если их ещё нет.
+    """
+    from helpers.models import BOT_TABLES
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all, tables=BOT_TABLES)
+
+# Индексы бота на таблицах Django под порядок keyset-пагинации каталога
+CATALOG_INDEXES = {
+    "bot_shop_subcategory_category_id_id": "shop_subcategory (category_id, id)",
+    "bot_shop_product_subcategory_id_id": "shop_product (subcategory_id, id)",
+}
+
+async def install_catalog_indexes():
+    """
+    Создаёт индексы из `CATALOG_INDEXES`, если их ещё нет.
+    """
+    async with engine.begin() as connection:
+        for name, columns in CATALOG_INDEXES.items():
+            await connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}"))
+    logger.info("Индексы каталога на месте: %s", ', '.join(CATALOG_INDEXES))
+
+# Уникальный индекс, по которому `add_to_cart` складывает количество (`ON CONFLICT (user_id, product_id)`)
+CART_UNIQUE_INDEX = "bot_shop_cart_user_id_product_id_uniq"
+
+async def install_cart_unique_index():
+    """
+    Создаёт уникальный индекс `shop_cart (user_id, product_id)`, если его ещё нет.
+    Дубли строк одного товара, оставшиеся от прежней логики, объединяются в одну строку с суммой количества.
+    """
+    async with engine.begin() as connection:
+        exists = await connection.scalar(text("""
+        SELECT EXISTS (SELECT 1 FROM pg_indexes WHERE tablename = 'shop_cart' AND indexname = :name)
+        """), {"name": CART_UNIQUE_INDEX})
+        if exists:
+            return
+
+        # Блокируем запись в корзину на время объединения дублей и создания индекса
+        await connection.execute(text("LOCK TABLE shop_cart IN SHARE ROW EXCLUSIVE MODE"))
+        await connection.execute(text("""
+        UPDATE shop_cart SET quantity = duplicates.total
+        FROM (
+            SELECT MIN(id) AS id, SUM(quantity) AS total FROM shop_cart
+            GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        ) duplicates
+        WHERE shop_cart.id = duplicates.id
+        """))
+        merged = await connection.execute(text("""
+        DELETE FROM shop_cart duplicate USING shop_cart kept
+        WHERE duplicate.user_id = kept.user_id AND duplicate.product_id = kept.product_id AND duplicate.id > kept.id
+        """))
+        await connection.execute(text(f"CREATE UNIQUE INDEX {CART_UNIQUE_INDEX} ON shop_cart (user_id, product_id)"))
+    logger.info("Создан уникальный индекс корзины %s, объединено дублей: %s", CART_UNIQUE_INDEX, merged.rowcount)
+
+
+class TTLCache:
+    """
+    Кэш в памяти процесса, ограниченный по числу записей (вытесняются давно не используемые)
+    и по времени жизни записи. Используется для каталога для соответствия Telegram ID -> `users_botuser.id`
+    и для уже сохранённых профилей пользователей.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generation = 0  # Увеличивается при каждом сбросе кэша
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Возвращает пару (найдено, значение). Просроченные записи удаляются.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, key, value, generation=None, ttl=None):
+        """
+        Сохраняет значение на `ttl` секунд (по умолчанию — время жизни кэша). Если кэш был сброшен,
+        пока значение загружалось из БД (`generation` устарел), значение не сохраняется, чтобы не вернуть старые данные.
+        """
+        if generation is not None and generation != self._generation:
+            return
+
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key, loader):
+        """
+        Возвращает значение из кэша, а при промахе загружает его через `loader()` и сохраняет.
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+
+        generation = self._generation
+        value = await loader()
+        self.set(key, value, generation)
+        return value
+
+    def discard(self, key):
+        """Удаляет одну запись, если она есть."""
+        self._entries.pop(key, None)
+
+    def invalidate(self, *_):
+        """Полностью очищает кэш."""
+        self._entries.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def stats(self):
+        """Возвращает счётчики кэша для мониторинга."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# Кэш каталога (категории, подкатегории, товары); сбрасывается целиком при изменении таблиц `shop_*`
+catalog_cache = TTLCache(max_size=CATALOG_CACHE_MAX_SIZE, ttl=CATALOG_CACHE_TTL)
+
+# Кэш Telegram ID -> `users_botuser.id` (соответствие не меняется, поэтому TTL большой)
+user_id_cache = TTLCache(max_size=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+
+# Кэш Telegram ID -> профиль (username, first_name, last_name), уже сохранённый в БД этим процессом
+seen_user_cache = TTLCache(max_size=SEEN_USER_CACHE_SIZE, ttl=SEEN_USER_CACHE_TTL)
+
+# Канал LISTEN/NOTIFY, в который триггеры пишут имя изменённой таблицы
+TABLE_CHANGES_CHANNEL = "bot_table_changed"
+
+# Таблицы, об изменении которых бот получает уведомления, и их обработчики
+table_change_listeners = {
+    "shop_category": [catalog_cache.invalidate],
+    "shop_subcategory": [catalog_cache.invalidate],
+    "shop_product": [catalog_cache.invalidate],
+    # Удаление или пересоздание пользователя в админке Django: сохранённые ID и профили больше не верны
+    "users_botuser": [user_id_cache.invalidate, seen_user_cache.invalidate],
+}
+
+# События, на которые срабатывает триггер уведомлений (по умолчанию — любые изменения таблицы).
+# Регистрация пользователей (`save_user`) меняет `users_botuser` постоянно и не должна сбрасывать кэши
+TABLE_CHANGE_EVENTS = {
+    "users_botuser": "UPDATE OF telegram_id OR DELETE OR TRUNCATE",
+}
+
+def on_table_change(table, callback):
+    """
+    Регистрирует `callback(table)`, вызываемый при изменении таблицы `table`.
+    """
+    table_change_listeners.setdefault(table, []).append(callback)
+
+def _notify_table_listeners(table):
+    for callback in table_change_listeners.get(table, []):
+        try:
+            callback(table)
+        except Exception as e:
+            logger.warning("Ошибка обработчика изменения таблицы %s: %s", table, e)
+
+async def install_change_triggers():
+    """
+    Создаёт в PostgreSQL триггеры, которые через NOTIFY сообщают боту об изменениях
+    в таблицах из `table_change_listeners` (например, при правке каталога в админке Django).
+    """
+    async with engine.begin() as connection:
+        await connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION bot_notify_table_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{TABLE_CHANGES_CHANNEL}', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """))
+        for table in table_change_listeners:
+            await connection.execute(text(f"DROP TRIGGER IF EXISTS bot_table_changed ON {table}"))
+            await connection.execute(text(f"""
+            CREATE TRIGGER bot_table_changed
+            AFTER {TABLE_CHANGE_EVENTS.get(table, "INSERT OR UPDATE OR DELETE OR TRUNCATE")} ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bot_notify_table_changed()
+            """))
+    logger.info("Триггеры уведомлений установлены для таблиц: %s", ', '.join(table_change_listeners))
+
+async def listen_table_changes(reconnect_delay=5):
     """
-    Проверяет, есть ли пользователь в БД.
-    Если нет – добавляет его в таблицу users_botuser.
+    Слушает канал уведомлений PostgreSQL и вызывает обработчики изменённых таблиц.
+    При потере соединения переподключается и сбрасывает все кэши, так как уведомления могли быть пропущены.
     """
-    from helpers.models import BotUser
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def handle_notification(connection, pid, channel, payload):
+        logger.info("Получено уведомление об изменении таблицы %s", payload)
+        _notify_table_listeners(payload)
+
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(TABLE_CHANGES_CHANNEL, handle_notification)
+
+            for table in table_change_listeners:
+                _notify_table_listeners(table)
+            logger.info("Подписка на канал `%s` активна", TABLE_CHANGES_CHANNEL)
+
+            await closed.wait()
+            logger.warning("Соединение для уведомлений об изменениях закрыто")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Ошибка подписки на уведомления об изменениях: %s", e)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+
+        await asyncio.sleep(reconnect_delay)
+
+async def get_user_db_id(telegram_id):
+    """
+    Возвращает `users_botuser.id` по Telegram ID через LRU-кэш или None, если пользователь не зарегистрирован.
+    Отсутствие пользователя кэшируется ненадолго (`USER_ID_NEGATIVE_TTL`), чтобы апдейты незарегистрированных
+    пользователей не ходили в БД каждый раз; `save_user` перезаписывает эту запись при регистрации.
+    """
+    found, user_db_id = user_id_cache.get(telegram_id)
+    if found:
+        return user_db_id
+
+    async with async_session_maker() as session:
+        result = await session.execute(text("SELECT id FROM users_botuser WHERE telegram_id = :telegram_id"), {"telegram_id": telegram_id})
+        user_db_id = result.scalar()
+
+    if user_db_id:
+        user_id_cache.set(telegram_id, user_db_id)
+    else:
+        user_id_cache.set(telegram_id, None, ttl=USER_ID_NEGATIVE_TTL)
+    return user_db_id
 
+async def save_user(user):
+    """
+    Регистрирует пользователя или обновляет его профиль одним запросом (upsert).
+    Если профиль не изменился, строка не перезаписывается. Пользователи, уже сохранённые этим процессом
+    с тем же профилем, пропускаются без обращения к БД (`seen_user_cache`).
+    Возвращает `users_botuser.id` или None, если запрос к БД не понадобился либо ID не удалось получить.
+    """
     telegram_id = user.id
-    first_name = user.first_name
-    last_name = user.last_name if user.last_name else ""
-    username = user.username if user.username else ""
+    profile = (user.username or "", user.first_name, user.last_name or "")
+
+    found, seen_profile = seen_user_cache.get(telegram_id)
+    if found and seen_profile == profile:
+        return None
+
+    username, first_name, last_name = profile
+    # Если строка есть и профиль не менялся, INSERT ничего не возвращает — тогда ID берём вторым SELECT
+    upsert_query = text("""
+    WITH upserted AS (
+        INSERT INTO users_botuser (telegram_id, username, first_name, last_name, created_at)
+        VALUES (:telegram_id, :username, :first_name, :last_name, :created_at)
+        ON CONFLICT (telegram_id) DO UPDATE
+        SET username = EXCLUDED.username, first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name
+        WHERE (users_botuser.username, users_botuser.first_name, users_botuser.last_name)
+              IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.first_name, EXCLUDED.last_name)
+        RETURNING id, xmax = 0 AS inserted
+    )
+    SELECT id, inserted, TRUE AS changed FROM upserted
+    UNION ALL
+    SELECT id, FALSE, FALSE FROM users_botuser
+    WHERE telegram_id = :telegram_id AND NOT EXISTS (SELECT 1 FROM upserted)
+    """)
 
     async with async_session_maker() as session:
-        result = await session.execute(select(BotUser).where(BotUser.telegram_id == telegram_id))
-        existing_user = result.scalar()
-        
-        if not existing_user:
-            new_user = BotUser(
-                telegram_id=telegram_id,
-                first_name=first_name,
-                last_name=last_name,
-                username=username,
-                created_at=datetime.utcnow()
-            )
-            session.add(new_user)
-            await session.commit()
-            logger.info(f"Новый пользователь сохранён: {first_name} {last_name} (@{username})")
+        result = await session.execute(upsert_query, {
+            "telegram_id": telegram_id,
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+            "created_at": datetime.utcnow(),
+        })
+        row = result.first()
+        await session.commit()
+
+    seen_user_cache.set(telegram_id, profile)
+    if row is None:
+        # Строку параллельно вставил другой запрос и она ещё не видна этому; ID найдёт `get_user_db_id`
+        user_id_cache.discard(telegram_id)
+        return None
+
+    user_id_cache.set(telegram_id, row.id)
+    if row.inserted:
+        logger.info("Новый пользователь сохранён: %s %s (@%s)", first_name, last_name, username)
+    elif row.changed:
+        logger.info("Профиль пользователя %s обновлён: %s %s (@%s)", telegram_id, first_name, last_name, username)
+    return row.id
 
 
 async def get_questions():
@@ -62,97 +444,303 @@ async def get_questions():
     async with async_session_maker() as session:
         result = await session.execute(select(Question))
         questions = result.scalars().all()
-        logger.info(f"Загружено {len(questions)} вопросов: {[q.text for q in questions]}")
+        logger.info("Загружено %s вопросов", len(questions))
         return questions
     
-async def get_categories(limit=5, offset=0):
+async def get_categories(after=None, before=None):
     """
-    Загружает список категорий из таблицы shop_category.
+    Загружает страницу категорий из таблицы shop_category после категории `after`
+    или перед категорией `before` (через кэш каталога).
+    Возвращает (категории, есть ли ещё категории в направлении листания).
     """
     from helpers.models import Category
-    async with async_session_maker() as session:
-        result = await session.execute(select(Category).limit(limit).offset(offset))
-        return result.scalars().all()
+    from settings.config import CATEGORIES_PER_PAGE
 
-async def get_subcategories(category_id, limit=5, offset=0):
+    async def load():
+        categories, has_more, _ = await seek_page(Category, limit=CATEGORIES_PER_PAGE, after=after, before=before)
+        return categories, has_more
+
+    return await catalog_cache.get_or_load(("categories", CATEGORIES_PER_PAGE, after, before), load)
+
+async def get_subcategories(category_id, after=None, before=None):
     """
-    Загружает список подкатегорий для заданной категории.
+    Загружает страницу подкатегорий для заданной категории после подкатегории `after`
+    или перед подкатегорией `before` (через кэш каталога).
+    Возвращает (подкатегории, есть ли ещё подкатегории в направлении листания).
     """
     from helpers.models import SubCategory
+    from settings.config import SUBCATEGORIES_PER_PAGE
 
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(SubCategory).where(SubCategory.category_id == category_id).limit(limit).offset(offset)
+    async def load():
+        subcategories, has_more, _ = await seek_page(
+            SubCategory, SubCategory.category_id == category_id,
+            limit=SUBCATEGORIES_PER_PAGE, after=after, before=before
         )
-        return result.scalars().all()
+        return subcategories, has_more
+
+    return await catalog_cache.get_or_load(("subcategories", category_id, SUBCATEGORIES_PER_PAGE, after, before), load)
+
+async def seek_page(model, *criteria, limit, after=None, before=None, with_total=False):
+    """
+    Keyset-пагинация по `id`: загружает до `limit` строк `model` с `id` больше `after`
+    (страница вперёд) или меньше `before` (страница назад) одним запросом с пробой `limit + 1`.
+    Возвращает (строки по возрастанию `id`, есть ли ещё строки в направлении листания, общее число строк).
+    Общее число считается тем же запросом, только если `with_total`, и равно None, если страница пуста.
+    """
+    query = select(model)
+    if with_total:
+        total = select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+        query = select(model, total)
+    query = query.where(*criteria)
+
+    if before is not None:
+        query = query.where(model.id < before).order_by(model.id.desc())
+    else:
+        if after is not None:
+            query = query.where(model.id > after)
+        query = query.order_by(model.id)
 
-async def get_products(subcategory_id, page=1):
+    async with async_session_maker() as session:
+        result = await session.execute(query.limit(limit + 1))
+        rows = result.all()
+
+    items = [row[0] for row in rows[:limit]]
+    if before is not None:
+        items.reverse()
+    total = rows[0][1] if with_total and rows else None
+    return items, len(rows) > limit, total
+
+async def get_products(subcategory_id, after=None, before=None):
     """
-    Загружает список товаров для подкатегории с учетом пагинации.
+    Загружает страницу товаров подкатегории после товара `after` или перед товаром `before` (через кэш каталога).
+    Возвращает (товары, есть ли ещё товары в направлении листания, общее число товаров в подкатегории).
     """
     from helpers.models import Product
     from settings.config import PRODUCTS_PER_PAGE
 
-    offset = (page - 1) * PRODUCTS_PER_PAGE
+    async def load():
+        page = await seek_page(
+            Product, Product.subcategory_id == subcategory_id,
+            limit=PRODUCTS_PER_PAGE, after=after, before=before, with_total=True
+        )
+        logger.info("Загружено %s товаров для подкатегории %s (после %s, перед %s)", len(page[0]), subcategory_id, after, before)
+        return page
+
+    return await catalog_cache.get_or_load(("products", subcategory_id, PRODUCTS_PER_PAGE, after, before), load)
+
+async def get_product(product_id):
+    """
+    Возвращает товар по ID или None (через кэш каталога).
+    """
+    from helpers.models import Product
+
+    async def load():
+        async with async_session_maker() as session:
+            return await session.get(Product, product_id)
+
+    return await catalog_cache.get_or_load(("product", product_id), load)
+
+async def create_order(user_db_id, delivery_info):
+    """
+    Оформляет заказ из корзины пользователя одним SQL-запросом в одной транзакции:
+    создаёт заказ, переносит позиции корзины в shop_orderitem, очищает корзину и считает сумму в БД.
+    Возвращает (order_id, total_amount: Decimal) или None, если корзина пуста.
+    """
+    create_order_query = text("""
+    WITH cart AS (
+        SELECT shop_cart.product_id, shop_cart.quantity, shop_product.price
+        FROM shop_cart
+        JOIN shop_product ON shop_product.id = shop_cart.product_id
+        WHERE shop_cart.user_id = :user_db_id
+    ),
+    new_order AS (
+        INSERT INTO shop_order (user_id, created_at, delivery_info)
+        SELECT :user_db_id, NOW(), :delivery_info
+        WHERE EXISTS (SELECT 1 FROM cart)
+        RETURNING id
+    ),
+    order_items AS (
+        INSERT INTO shop_orderitem (order_id, product_id, quantity)
+        SELECT new_order.id, cart.product_id, cart.quantity
+        FROM new_order CROSS JOIN cart
+    ),
+    cleared_cart AS (
+        DELETE FROM shop_cart
+        WHERE user_id = :user_db_id AND product_id IN (SELECT product_id FROM cart) AND EXISTS (SELECT 1 FROM new_order)
+    )
+    SELECT new_order.id, (SELECT SUM(cart.price * cart.quantity) FROM cart) AS total_amount
+    FROM new_order
+    """)
 
     async with async_session_maker() as session:
-        result = await session.execute(
-            select(Product)
-            .where(Product.subcategory_id == subcategory_id)
-            .limit(PRODUCTS_PER_PAGE)
-            .offset(offset)
-        )
-        products = result.scalars().all()
+        result = await session.execute(create_order_query, {"user_db_id": user_db_id, "delivery_info": delivery_info})
+        order = result.fetchone()
+        await session.commit()
+
+    if order is None:
+        return None
 
-        logger.info(f"Загружено {len(products)} товаров для подкатегории {subcategory_id}, страница {page}")
-        return products
+    logger.info("Заказ `%s` на сумму %s создан для пользователя `id=%s`, корзина очищена.", order.id, order.total_amount, user_db_id)
+    return order.id, order.total_amount
 
-async def add_to_cart(user_id, product_id, quantity):
+async def cancel_order(order_id, user_db_id):
     """
-    Добавляет товар в корзину или обновляет количество, используя `id`, а не `telegram_id`.
+    Отменяет неоплаченный заказ одним запросом: возвращает его позиции в корзину пользователя
+    (складывая с тем, что успели добавить после оформления) и удаляет заказ.
+    Используется, если платёж для заказа создать не удалось.
     """
+    cancel_order_query = text("""
+    WITH removed_items AS (
+        DELETE FROM shop_orderitem WHERE order_id = :order_id
+        RETURNING product_id, quantity
+    ),
+    restored_cart AS (
+        INSERT INTO shop_cart (user_id, product_id, quantity, added_at)
+        SELECT :user_db_id, product_id, SUM(quantity), NOW() FROM removed_items GROUP BY product_id
+        ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = shop_cart.quantity + EXCLUDED.quantity
+    )
+    DELETE FROM shop_order WHERE id = :order_id AND user_id = :user_db_id
+    """)
+
     async with async_session_maker() as session:
-        logger.info(f"🔍 Получаем `id` для `telegram_id={user_id}`.")
+        await session.execute(cancel_order_query, {"order_id": order_id, "user_db_id": user_db_id})
+        await session.commit()
 
-        # Получаем `id` по `telegram_id`
-        user_check_query = text("SELECT id FROM users_botuser WHERE telegram_id = :user_id")
-        result = await session.execute(user_check_query, {"user_id": user_id})
-        user_db_id = result.scalar()
+    logger.info("Заказ `%s` отменён, позиции возвращены в корзину пользователя `id=%s`.", order_id, user_db_id)
 
-        if not user_db_id:
-            logger.error(f"Ошибка! `telegram_id={user_id}` не найден в `users_botuser`.")
-            return  # Останавливаем выполнение
+async def get_cart_page(user_db_id, page, per_page):
+    """
+    Загружает страницу корзины вместе с итогами по всей корзине одним запросом:
+    число позиций, число товаров и сумма считаются оконными функциями до LIMIT.
+    Если страница за пределами корзины (например, после удаления последней позиции), возвращается последняя.
+    Возвращает (позиции, номер страницы, число позиций, число товаров, сумма) или None, если корзина пуста.
+    """
+    cart_query = text("""
+    SELECT shop_product.id, shop_product.name, shop_product.price, shop_cart.quantity,
+           COUNT(*) OVER () AS lines,
+           SUM(shop_cart.quantity) OVER () AS items,
+           SUM(shop_product.price * shop_cart.quantity) OVER () AS total
+    FROM shop_cart
+    JOIN shop_product ON shop_product.id = shop_cart.product_id
+    WHERE shop_cart.user_id = :user_db_id
+    ORDER BY shop_cart.id
+    LIMIT :limit OFFSET :offset
+    """)
 
+    async with async_session_maker() as session:
+        while True:
+            result = await session.execute(cart_query, {"user_db_id": user_db_id, "limit": per_page, "offset": (page - 1) * per_page})
+            rows = result.fetchall()
+            if rows or page == 1:
+                break
+            page -= 1
+
+    if not rows:
+        return None
+    return rows, page, rows[0].lines, rows[0].items, rows[0].total
+
+async def change_cart_quantity(user_db_id, product_id, delta):
+    """
+    Меняет количество товара в корзине на `delta` одним запросом; если оно становится меньше 1, позиция удаляется.
+    Возвращает новое количество (0 — позиция удалена) или None, если товара в корзине нет.
+    """
+    change_query = text("""
+    WITH changed AS (
+        UPDATE shop_cart SET quantity = quantity + :delta
+        WHERE user_id = :user_db_id AND product_id = :product_id AND quantity + :delta > 0
+        RETURNING quantity
+    ),
+    removed AS (
+        DELETE FROM shop_cart
+        WHERE user_id = :user_db_id AND product_id = :product_id AND quantity + :delta <= 0
+        RETURNING 0 AS quantity
+    )
+    SELECT quantity FROM changed UNION ALL SELECT quantity FROM removed
+    """)
+
+    async with async_session_maker() as session:
+        result = await session.execute(change_query, {"user_db_id": user_db_id, "product_id": product_id, "delta": delta})
+        quantity = result.scalar()
         await session.commit()
-        session.expire_all()
-
-        logger.info(f"`id={user_db_id}` найден! Используем его при обработке `shop_cart`.")
-
-        # Проверяем, есть ли товар в `shop_cart`
-        check_cart_query = text("""
-        SELECT quantity FROM shop_cart WHERE user_id = :user_db_id AND product_id = :product_id
-        """)
-        result = await session.execute(check_cart_query, {"user_db_id": user_db_id, "product_id": product_id})
-        existing_quantity = result.scalar()
-
-        if existing_quantity:
-            # Если товар уже есть, обновляем количество
-            new_quantity = existing_quantity + quantity
-            logger.info(f"Товар {product_id} уже в корзине, обновляем количество до {new_quantity}.")
-
-            update_cart_query = text("""
-            UPDATE shop_cart SET quantity = :new_quantity WHERE user_id = :user_db_id AND product_id = :product_id
-            """)
-            await session.execute(update_cart_query, {"new_quantity": new_quantity, "user_db_id": user_db_id, "product_id": product_id})
-        else:
-            # Если товара ещё нет, добавляем новую запись
-            logger.info(f"Товар {product_id} отсутствует в корзине, добавляем новый.")
-
-            insert_cart_query = text("""
-            INSERT INTO shop_cart (user_id, product_id, quantity, added_at)
-            VALUES (:user_db_id, :product_id, :quantity, NOW())
-            """)
-            await session.execute(insert_cart_query, {"user_db_id": user_db_id, "product_id": product_id, "quantity": quantity})
+    return quantity
 
+async def remove_from_cart(user_db_id, product_id):
+    """
+    Удаляет товар из корзины пользователя.
+    """
+    async with async_session_maker() as session:
+        remove_query = text("DELETE FROM shop_cart WHERE user_id = :user_db_id AND product_id = :product_id")
+        await session.execute(remove_query, {"user_db_id": user_db_id, "product_id": product_id})
         await session.commit()
-        logger.info(f"Товар {product_id} обработан для пользователя `id={user_db_id}`.")
+
+def _cart_user(user_db_id, telegram_id):
+    """
+    Источник `users_botuser.id` для записи в корзину: известный ID или поиск по Telegram ID
+    внутри того же запроса (без отдельного обращения к БД).
+    """
+    if user_db_id:
+        return "(SELECT CAST(:user_db_id AS integer) AS id)", {"user_db_id": user_db_id}
+    if telegram_id is None:
+        raise ValueError("Нужен user_db_id или telegram_id")
+    return "(SELECT id FROM users_botuser WHERE telegram_id = :telegram_id)", {"telegram_id": telegram_id}
+
+async def add_to_cart(user_db_id, product_id, quantity, telegram_id=None):
+    """
+    Добавляет товар в корзину или увеличивает его количество одним запросом `INSERT ... ON CONFLICT`.
+    Одновременные добавления одного товара складываются, а не теряются. Если `user_db_id` неизвестен,
+    пользователь ищется по `telegram_id` в том же запросе.
+    Возвращает новое количество товара в корзине или None, если пользователь не зарегистрирован.
+    """
+    cart_user, params = _cart_user(user_db_id, telegram_id)
+    add_query = text(f"""
+    INSERT INTO shop_cart (user_id, product_id, quantity, added_at)
+    SELECT cart_user.id, :product_id, :quantity, NOW() FROM {cart_user} cart_user
+    ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = shop_cart.quantity + EXCLUDED.quantity
+    RETURNING user_id, quantity
+    """)
+
+    async with async_session_maker() as session:
+        result = await session.execute(add_query, {**params, "product_id": product_id, "quantity": quantity})
+        row = result.fetchone()
+        await session.commit()
+
+    if row is None:
+        return None
+    if telegram_id is not None:
+        user_id_cache.set(telegram_id, row.user_id)
+    logger.info("Товар %s в корзине пользователя `id=%s`: %s шт.", product_id, row.user_id, row.quantity)
+    return row.quantity
+
+async def add_many_to_cart(user_db_id, items, telegram_id=None):
+    """
+    Добавляет в корзину сразу несколько товаров одним запросом. `items` — пары (ID товара, количество),
+    повторы одного товара складываются. Возвращает {ID товара: новое количество}
+    (пустой словарь, если пользователь не зарегистрирован).
+    """
+    quantities = {}
+    for product_id, quantity in items:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        return {}
+
+    cart_user, params = _cart_user(user_db_id, telegram_id)
+    add_query = text(f"""
+    INSERT INTO shop_cart (user_id, product_id, quantity, added_at)
+    SELECT cart_user.id, item.product_id, item.quantity, NOW()
+    FROM {cart_user} cart_user
+    CROSS JOIN unnest(CAST(:product_ids AS integer[]), CAST(:quantities AS integer[])) AS item(product_id, quantity)
+    ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = shop_cart.quantity + EXCLUDED.quantity
+    RETURNING user_id, product_id, quantity
+    """)
+
+    async with async_session_maker() as session:
+        result = await session.execute(add_query, {
+            **params, "product_ids": list(quantities), "quantities": list(quantities.values()),
+        })
+        rows = result.fetchall()
+        await session.commit()
+
+    if rows and telegram_id is not None:
+        user_id_cache.set(telegram_id, rows[0].user_id)
+    logger.info("В корзину пользователя `id=%s` добавлено товаров: %s", rows[0].user_id if rows else None, len(rows))
+    return {row.product_id: row.quantity for row in rows}
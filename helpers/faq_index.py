@@ -0,0 +1,176 @@
+import re
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+
+from helpers.database import get_questions, on_table_change
+from settings.config import FAQ_INDEX_TTL
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+
+# Окончания, которые отбрасываются при нормализации слов (от длинных к коротким)
+RUSSIAN_ENDINGS = sorted([
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый", "ая", "яя",
+    "ое", "ее", "ые", "ие", "ом", "ем", "ам", "ям", "ах", "ях", "ую", "юю", "ов", "ев",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+
+QUESTION_WEIGHT = 3.0  # Совпадение в тексте вопроса важнее совпадения в ответе
+ANSWER_WEIGHT = 1.0
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+FUZZY_MIN_SIMILARITY = 0.35  # Минимальная доля общих триграмм для нечёткого совпадения
+
+
+def normalize(text):
+    """
+    Приводит текст к нижнему регистру и заменяет «ё» на «е».
+    """
+    return text.lower().replace("ё", "е")
+
+def stem(word):
+    """
+    Упрощённо отбрасывает падежное окончание, оставляя основу не короче 3 символов.
+    """
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+def tokenize(text):
+    """
+    Разбивает текст на нормализованные основы слов.
+    """
+    return [stem(word) for word in WORD_RE.findall(normalize(text))]
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FaqIndex:
+    """
+    Поисковый индекс по вопросам и ответам FAQ в памяти процесса.
+    Строится один раз из таблицы faq_question и перестраивается после её изменения,
+    поэтому инлайн-запросы обслуживаются без обращений к БД.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.questions = []
+        self.version = 0  # Увеличивается при каждой перестройке индекса
+        self._postings = {}  # основа -> {номер вопроса: вес}
+        self._terms = []  # Отсортированные основы для поиска по префиксу
+        self._trigrams = {}  # триграмма -> множество основ
+        self._phrases = []  # Нормализованный текст вопросов для поиска фразы целиком
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self, *_):
+        """Помечает индекс устаревшим: он будет перестроен при следующем запросе."""
+        self._expires_at = 0.0
+
+    async def ensure_fresh(self):
+        """
+        Перестраивает индекс, если он устарел. Пока идёт перестройка, остальные запросы
+        обслуживаются старой версией индекса.
+        """
+        if self._expires_at > time.monotonic():
+            return
+        if self._lock.locked() and self.version:
+            return
+
+        async with self._lock:
+            if self._expires_at > time.monotonic():
+                return
+            self._expires_at = time.monotonic() + self.ttl
+            try:
+                self.build(await get_questions())
+            except Exception:
+                self._expires_at = 0.0
+                raise
+
+    def build(self, questions):
+        """
+        Строит индекс по списку объектов `Question`.
+        """
+        postings = {}
+        for position, question in enumerate(questions):
+            for text, weight in ((question.text, QUESTION_WEIGHT), (question.answer, ANSWER_WEIGHT)):
+                for term in tokenize(text):
+                    doc_weights = postings.setdefault(term, {})
+                    doc_weights[position] = max(doc_weights.get(position, 0.0), weight)
+
+        term_trigrams = {}
+        for term in postings:
+            for trigram in trigrams(term):
+                term_trigrams.setdefault(trigram, set()).add(term)
+
+        self.questions = list(questions)
+        self._postings = postings
+        self._terms = sorted(postings)
+        self._trigrams = term_trigrams
+        self._phrases = [normalize(question.text) for question in questions]
+        self.version += 1
+        logger.info("Индекс FAQ построен: %s вопросов, %s основ", len(questions), len(postings))
+
+    def _match_terms(self, token):
+        """
+        Возвращает {основа: оценка совпадения} для слова запроса:
+        точное совпадение, совпадение по префиксу или нечёткое по триграммам.
+        """
+        matches = {}
+        if token in self._postings:
+            matches[token] = EXACT_SCORE
+
+        position = bisect_left(self._terms, token)
+        while position < len(self._terms) and self._terms[position].startswith(token):
+            matches.setdefault(self._terms[position], PREFIX_SCORE)
+            position += 1
+
+        if matches or len(token) < 3:
+            return matches
+
+        token_trigrams = trigrams(token)
+        candidates = {}
+        for trigram in token_trigrams:
+            for term in self._trigrams.get(trigram, ()):
+                candidates[term] = candidates.get(term, 0) + 1
+        for term, shared in candidates.items():
+            similarity = shared / (len(token_trigrams) + len(trigrams(term)) - shared)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches[term] = FUZZY_SCORE * similarity
+        return matches
+
+    def search(self, query, limit=50):
+        """
+        Ищет вопросы по запросу и возвращает их в порядке релевантности.
+        Пустой запрос возвращает все вопросы.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return self.questions[:limit]
+
+        scores = {}
+        matched_tokens = {}
+        for token in tokens:
+            for term, match_score in self._match_terms(token).items():
+                for position, weight in self._postings[term].items():
+                    scores[position] = scores.get(position, 0.0) + weight * match_score
+                    matched_tokens.setdefault(position, set()).add(token)
+
+        phrase = normalize(query).strip()
+        for position in scores:
+            if phrase and phrase in self._phrases[position]:
+                scores[position] += QUESTION_WEIGHT
+
+        ranked = sorted(scores, key=lambda position: (-len(matched_tokens[position]), -scores[position], position))
+        return [self.questions[position] for position in ranked[:limit]]
+
+
+faq_index = FaqIndex(ttl=FAQ_INDEX_TTL)
+on_table_change("faq_question", faq_index.mark_stale)
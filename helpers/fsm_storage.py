@@ -0,0 +1,123 @@
+import json
+import asyncio
+import logging
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy.sql import text
+
+from helpers.database import async_session_maker
+from settings.config import FSM_STORAGE, FSM_STATE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class SqlStorage(BaseStorage):
+    """
+    Хранилище состояний FSM aiogram в таблице `bot_fsm_state`.
+    Диалоги (ввод количества, данных доставки) переживают перезапуск и общие для всех процессов бота.
+    Запись, которую не трогали дольше `ttl` секунд, считается пустой и удаляется при обслуживании.
+    """
+
+    def __init__(self, ttl, key_builder=None):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        async with async_session_maker() as session:
+            await session.execute(text("""
+            INSERT INTO bot_fsm_state (key, state, data, updated_at) VALUES (:key, :state, '{}', NOW())
+            ON CONFLICT (key) DO UPDATE
+            SET state = EXCLUDED.state,
+                data = CASE WHEN bot_fsm_state.updated_at < NOW() - make_interval(secs => :ttl) THEN '{}' ELSE bot_fsm_state.data END,
+                updated_at = NOW()
+            """), {"key": self.key_builder.build(key), "state": state, "ttl": self.ttl})
+            await session.commit()
+
+    async def get_state(self, key):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            SELECT state FROM bot_fsm_state WHERE key = :key AND updated_at >= NOW() - make_interval(secs => :ttl)
+            """), {"key": self.key_builder.build(key), "ttl": self.ttl})
+            return result.scalar()
+
+    async def set_data(self, key, data):
+        async with async_session_maker() as session:
+            await session.execute(text("""
+            INSERT INTO bot_fsm_state (key, data, updated_at) VALUES (:key, CAST(:data AS jsonb), NOW())
+            ON CONFLICT (key) DO UPDATE
+            SET data = EXCLUDED.data,
+                state = CASE WHEN bot_fsm_state.updated_at < NOW() - make_interval(secs => :ttl) THEN NULL ELSE bot_fsm_state.state END,
+                updated_at = NOW()
+            """), {"key": self.key_builder.build(key), "data": json.dumps(data), "ttl": self.ttl})
+            await session.commit()
+
+    async def get_data(self, key):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            SELECT data FROM bot_fsm_state WHERE key = :key AND updated_at >= NOW() - make_interval(secs => :ttl)
+            """), {"key": self.key_builder.build(key), "ttl": self.ttl})
+            return dict(result.scalar() or {})
+
+    async def update_data(self, key, data):
+        # Слияние выполняется одним запросом, без чтения данных в бота
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            INSERT INTO bot_fsm_state (key, data, updated_at) VALUES (:key, CAST(:data AS jsonb), NOW())
+            ON CONFLICT (key) DO UPDATE
+            SET data = CASE WHEN bot_fsm_state.updated_at < NOW() - make_interval(secs => :ttl) THEN '{}' ELSE bot_fsm_state.data END || EXCLUDED.data,
+                state = CASE WHEN bot_fsm_state.updated_at < NOW() - make_interval(secs => :ttl) THEN NULL ELSE bot_fsm_state.state END,
+                updated_at = NOW()
+            RETURNING data
+            """), {"key": self.key_builder.build(key), "data": json.dumps(data), "ttl": self.ttl})
+            merged = result.scalar()
+            await session.commit()
+            return dict(merged)
+
+    async def delete_expired(self):
+        """Удаляет записи, которые не трогали дольше `ttl`, и пустые записи. Возвращает их число."""
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            DELETE FROM bot_fsm_state
+            WHERE updated_at < NOW() - make_interval(secs => :ttl) OR (state IS NULL AND data = '{}')
+            """), {"ttl": self.ttl})
+            await session.commit()
+            return result.rowcount
+
+    async def close(self):
+        pass
+
+
+FSM_STORAGE_BACKENDS = {
+    "memory": lambda: MemoryStorage(),
+    "sql": lambda: SqlStorage(ttl=FSM_STATE_TTL),
+}
+
+def create_fsm_storage(backend):
+    """
+    Создаёт хранилище состояний FSM по имени бэкенда из `FSM_STORAGE_BACKENDS`.
+    """
+    if backend not in FSM_STORAGE_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд хранилища состояний: {backend}")
+    return FSM_STORAGE_BACKENDS[backend]()
+
+
+fsm_storage = create_fsm_storage(FSM_STORAGE)
+
+async def run_fsm_storage_maintenance(interval):
+    """
+    Периодически удаляет устаревшие состояния диалогов (только для хранилища в БД).
+    """
+    if not isinstance(fsm_storage, SqlStorage):
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            deleted = await fsm_storage.delete_expired()
+            logger.info("Хранилище состояний: удалено устаревших записей %s", deleted)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Ошибка обслуживания хранилища состояний: %s", e)
@@ -0,0 +1,144 @@
+import os
+import json
+import atexit
+import queue
+import random
+import logging
+from datetime import datetime, timezone
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from dotenv import load_dotenv
+
+# Загружаем `.env`
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Общий уровень логирования
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # Уровни отдельных модулей: "aiogram.event=WARNING,helpers.payments=DEBUG"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" — по записи JSON на строку, "text" — как раньше
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")  # Доля сохраняемых записей ниже WARNING: "aiogram.event=0.1"
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+
+# Контекст текущего апдейта, попадает в каждую запись лога
+log_user_id = ContextVar("log_user_id", default=None)
+log_update_id = ContextVar("log_update_id", default=None)
+
+_listener = None
+
+
+def parse_mapping(value, convert):
+    """Разбирает строку вида "a=1,b=2" в словарь."""
+    mapping = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            mapping[name.strip()] = convert(setting.strip())
+    return mapping
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись ID пользователя и апдейта из контекста текущей задачи."""
+
+    def filter(self, record):
+        record.user_id = log_user_id.get()
+        record.update_id = log_update_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Оставляет лишь долю `rate` записей ниже WARNING от логгеров из `rates` (с учётом дочерних логгеров).
+    Предупреждения и ошибки сохраняются всегда.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition(".")[0]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как одну строку JSON."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "user_id", None) is not None:
+            entry["user_id"] = record.user_id
+        if getattr(record, "update_id", None) is not None:
+            entry["update_id"] = record.update_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь как есть: сообщение форматирует и пишет в файл поток `QueueListener`,
+    а не цикл событий. Контекст апдейта добавляется до постановки в очередь.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(log_file=LOG_FILE):
+    """
+    Настраивает логирование: обработчики вызываются в отдельном потоке через очередь,
+    записи содержат ID пользователя и апдейта, уровни и выборка задаются по модулям.
+    Вызывается в каждом процессе бота.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    handlers = [
+        RotatingFileHandler(log_file, maxBytes=5_000_000, backupCount=3, encoding="utf-8"),  # Логи сохраняются в файл размером до 5MB, храним 3 файла
+        logging.StreamHandler()  # Логи выводятся в консоль
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(parse_mapping(LOG_SAMPLING, float)))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_mapping(LOG_LEVELS, str.upper).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+@atexit.register
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток логирования (вызывается при выходе)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
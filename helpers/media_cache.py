@@ -0,0 +1,152 @@
+import hashlib
+import logging
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.sql import text
+
+from helpers.database import async_session_maker, engine, on_table_change
+
+logger = logging.getLogger(__name__)
+
+def image_hash(image):
+    """
+    Возвращает хэш пути/URL изображения: он меняется, если в админке загрузили файл под другим именем.
+    Замену файла под тем же именем хэш не заметит, такие записи удаляет триггер `install_media_cache_trigger`.
+    """
+    return hashlib.sha1(image.encode("utf-8")).hexdigest()
+
+
+class MediaCache:
+    """
+    Кэш `file_id`, которые Telegram возвращает после первой отправки изображения товара.
+    Хранится в таблице `bot_media_cache` (ключ — ID товара и хэш изображения) с копией в памяти процесса.
+    Повторные показы товара отправляют `file_id`, и Telegram не скачивает картинку с нашего сервера заново.
+    """
+
+    def __init__(self):
+        self._file_ids = {}  # product_id -> (хэш изображения, file_id)
+
+    async def get(self, product_id, image):
+        """
+        Возвращает `file_id` для текущего изображения товара или None.
+        """
+        current_hash = image_hash(image)
+        cached = self._file_ids.get(product_id)
+        if cached and cached[0] == current_hash:
+            return cached[1]
+
+        # Запись могла появиться в БД от другого процесса бота
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            SELECT file_id FROM bot_media_cache WHERE product_id = :product_id AND image_hash = :image_hash
+            """), {"product_id": product_id, "image_hash": current_hash})
+            file_id = result.scalar()
+
+        if file_id:
+            self._file_ids[product_id] = (current_hash, file_id)
+        return file_id
+
+    async def remember(self, product_id, image, file_id):
+        """
+        Сохраняет `file_id` изображения товара, заменяя запись для прежнего изображения.
+        """
+        current_hash = image_hash(image)
+        self._file_ids[product_id] = (current_hash, file_id)
+        async with async_session_maker() as session:
+            await session.execute(text("""
+            INSERT INTO bot_media_cache (product_id, image_hash, file_id, updated_at)
+            VALUES (:product_id, :image_hash, :file_id, NOW())
+            ON CONFLICT (product_id) DO UPDATE
+            SET image_hash = EXCLUDED.image_hash, file_id = EXCLUDED.file_id, updated_at = EXCLUDED.updated_at
+            """), {"product_id": product_id, "image_hash": current_hash, "file_id": file_id})
+            await session.commit()
+
+    def clear_memory(self, *_):
+        """Очищает копию кэша в памяти процесса; записи в БД остаются."""
+        self._file_ids.clear()
+
+    async def forget(self, product_id):
+        """Удаляет `file_id` товара (например, если Telegram его больше не принимает)."""
+        self._file_ids.pop(product_id, None)
+        async with async_session_maker() as session:
+            await session.execute(text("DELETE FROM bot_media_cache WHERE product_id = :product_id"), {"product_id": product_id})
+            await session.commit()
+
+
+media_cache = MediaCache()
+
+# Записи в БД удаляет триггер, а копию в памяти сбрасываем при любом изменении товаров
+on_table_change("shop_product", media_cache.clear_memory)
+
+async def install_media_cache_trigger():
+    """
+    Создаёт триггер, который удаляет `file_id` товара при сохранении поля `image`. Django перезаписывает
+    все поля при сохранении товара, поэтому триггер срабатывает и когда картинку заменили файлом
+    с тем же именем (путь, а значит и хэш, не меняется).
+    """
+    async with engine.begin() as connection:
+        await connection.execute(text("""
+        CREATE OR REPLACE FUNCTION bot_forget_product_media() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM bot_media_cache WHERE product_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """))
+        await connection.execute(text("DROP TRIGGER IF EXISTS bot_forget_product_media ON shop_product"))
+        await connection.execute(text("""
+        CREATE TRIGGER bot_forget_product_media
+        AFTER UPDATE OF image ON shop_product
+        FOR EACH ROW EXECUTE FUNCTION bot_forget_product_media()
+        """))
+    logger.info("Триггер сброса `file_id` при замене изображений товаров установлен")
+
+async def send_product_photo(send_photo, product_id, image, **kwargs):
+    """
+    Отправляет фото товара через `send_photo` (например, `message.answer_photo`).
+    Если для изображения известен `file_id`, отправляет его; иначе отправляет путь/URL
+    и запоминает `file_id`, который вернул Telegram.
+    """
+    file_id = await media_cache.get(product_id, image)
+    if file_id:
+        try:
+            return await send_photo(photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning("Telegram не принял сохранённый file_id товара %s: %s", product_id, e)
+            await media_cache.forget(product_id)
+
+    sent_message = await send_photo(photo=image, **kwargs)
+    if sent_message.photo:
+        await media_cache.remember(product_id, image, sent_message.photo[-1].file_id)
+    return sent_message
+
+async def send_product_album(answer_media_group, items):
+    """
+    Отправляет фото нескольких товаров одним альбомом (2–10 фото) через `answer_media_group`.
+    `items` — список (product_id, изображение, подпись). Использует и пополняет кэш `file_id`.
+    """
+    file_ids = [await media_cache.get(product_id, image) for product_id, image, _ in items]
+
+    def build_media(use_cache):
+        return [
+            types.InputMediaPhoto(media=(file_id if use_cache and file_id else image), caption=caption, parse_mode="Markdown")
+            for (_, image, caption), file_id in zip(items, file_ids)
+        ]
+
+    try:
+        sent_messages = await answer_media_group(media=build_media(use_cache=True))
+    except TelegramBadRequest as e:
+        if not any(file_ids):
+            raise
+        logger.warning("Telegram не принял сохранённые file_id альбома: %s", e)
+        for (product_id, _, _), file_id in zip(items, file_ids):
+            if file_id:
+                await media_cache.forget(product_id)
+        file_ids = [None] * len(items)
+        sent_messages = await answer_media_group(media=build_media(use_cache=False))
+
+    for (product_id, image, _), file_id, sent_message in zip(items, file_ids, sent_messages):
+        if not file_id and sent_message.photo:
+            await media_cache.remember(product_id, image, sent_message.photo[-1].file_id)
+    return sent_messages
@@ -1,48 +1,93 @@
+import asyncio
 import logging
 from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramNotFound
+from helpers.message_store import message_store
+from settings.config import CLEANUP_IN_BACKGROUND, CLEANUP_CONCURRENCY
 
 logger = logging.getLogger(__name__)
 
-# Словарь для хранения ID последнего сообщения
-last_message = {}
+# Максимум ID в одном вызове `deleteMessages` (ограничение Bot API)
+DELETE_MESSAGES_BATCH_SIZE = 100
+
+# Фоновые задачи удаления, чтобы их не удалил сборщик мусора
+_cleanup_tasks = set()
 
 async def delete_previous_message(bot: Bot, user_id: int):
     """
     Удаляет предыдущее сообщение пользователя, если оно есть.
+    ID убирается из хранилища в любом случае: сообщение, которое не удалось удалить сейчас,
+    скорее всего, уже удалено или слишком старое, и повторные попытки бесполезны.
     """
-    if user_id in last_message and last_message[user_id]:  # Проверяем, есть ли сообщения
-        message_id = last_message[user_id][-1]  # Берём последнее сообщение из списка
-        logger.info(f"Попытка удалить предыдущее сообщение: {message_id} для пользователя {user_id}")
-        try:
-            await bot.delete_message(chat_id=user_id, message_id=message_id)
-            logger.info(f"Сообщение {message_id} успешно удалено")
-            last_message[user_id].pop()  # Удаляем ID из списка
-        except Exception as e:
-            logger.warning(f"Ошибка удаления сообщения {message_id}: {e}")
-
-async def delete_all_previous_messages(bot: Bot, user_id: int):
-    """Удаляет ВСЕ предыдущие сообщения пользователя перед загрузкой новых товаров."""
-    if user_id in last_message:
-        message_ids = last_message[user_id]
-        logger.info(f"Попытка удалить ВСЕ предыдущие сообщения: {message_ids} для пользователя {user_id}")
-        for message_id in message_ids:
+    message_id = await message_store.pop_last(user_id)  # Берём последнее сообщение
+    if message_id is None:
+        return
+
+    logger.info("Попытка удалить предыдущее сообщение: %s для пользователя %s", message_id, user_id)
+    try:
+        await bot.delete_message(chat_id=user_id, message_id=message_id)
+        logger.info("Сообщение %s успешно удалено", message_id)
+    except Exception as e:
+        logger.warning("Ошибка удаления сообщения %s: %s", message_id, e)
+
+async def _delete_one_by_one(bot: Bot, user_id: int, message_ids):
+    """Удаляет сообщения по одному, не более `CLEANUP_CONCURRENCY` запросов одновременно."""
+    semaphore = asyncio.Semaphore(CLEANUP_CONCURRENCY)
+
+    async def delete(message_id):
+        async with semaphore:
             try:
                 await bot.delete_message(chat_id=user_id, message_id=message_id)
-                logger.info(f"Сообщение {message_id} успешно удалено")
             except Exception as e:
-                logger.warning(f"Ошибка удаления сообщения {message_id}: {e}")
-        last_message[user_id] = []  # Очищаем список сообщений
+                logger.warning("Ошибка удаления сообщения %s: %s", message_id, e)
+
+    await asyncio.gather(*(delete(message_id) for message_id in message_ids))
+
+async def delete_messages(bot: Bot, user_id: int, message_ids):
+    """
+    Удаляет сообщения пачками через `deleteMessages` (до 100 ID за запрос).
+    По одному пачка удаляется, только если поштучное удаление может помочь: метод не поддерживается
+    сервером Bot API или запрос не дошёл. Пачка, отклонённая Telegram (все сообщения старше 48 часов
+    или уже удалены), отбрасывается, чтобы не тратить до 100 лишних запросов.
+    """
+    for start in range(0, len(message_ids), DELETE_MESSAGES_BATCH_SIZE):
+        batch = message_ids[start:start + DELETE_MESSAGES_BATCH_SIZE]
+        try:
+            await bot.delete_messages(chat_id=user_id, message_ids=batch)
+            logger.info("Удалено сообщений пачкой: %s для пользователя %s", len(batch), user_id)
+        except (TelegramNotFound, TelegramNetworkError) as e:
+            logger.warning("Ошибка пакетного удаления сообщений %s: %s, удаляем по одному", batch, e)
+            await _delete_one_by_one(bot, user_id, batch)
+        except Exception as e:
+            logger.warning("Пакетное удаление сообщений %s не удалось: %s, пропускаем", batch, e)
+
+async def delete_all_previous_messages(bot: Bot, user_id: int, background: bool = CLEANUP_IN_BACKGROUND):
+    """
+    Удаляет ВСЕ предыдущие сообщения пользователя перед загрузкой новых товаров.
+    При `background=True` удаление идёт в фоне и не задерживает отправку новых сообщений
+    (ID забираются из хранилища сразу, поэтому новые сообщения не будут затронуты).
+    """
+    message_ids = await message_store.take_all(user_id)
+    if not message_ids:
+        return
+
+    logger.info("Удаляем ВСЕ предыдущие сообщения: %s для пользователя %s", message_ids, user_id)
+    if not background:
+        await delete_messages(bot, user_id, message_ids)
+        return
+
+    task = asyncio.create_task(delete_messages(bot, user_id, message_ids))
+    _cleanup_tasks.add(task)
+    task.add_done_callback(_cleanup_tasks.discard)
 
 async def save_last_message(user_id: int, message):
-    """Сохраняет ID последнего отправленного сообщения (в виде списка)."""
+    """Сохраняет ID последнего отправленного сообщения."""
     if message and hasattr(message, "message_id"):
-        if user_id not in last_message:
-            last_message[user_id] = []
-        last_message[user_id].append(message.message_id)  # Добавляем в список
-        logger.info(f"Сохранен ID сообщения: {message.message_id} для пользователя {user_id}")
+        await message_store.push(user_id, message.message_id)
+        logger.info("Сохранен ID сообщения: %s для пользователя %s", message.message_id, user_id)
 
 async def get_last_message_id(user_id: int):
     """
-    Возвращает ID последнего сообщения пользователя, если оно есть.
+    Возвращает список ID сообщений пользователя (последнее — в конце), если они есть.
     """
-    return last_message.get(user_id, None)
+    return await message_store.get_all(user_id) or None
@@ -0,0 +1,173 @@
+import sys
+import time
+import asyncio
+import logging
+from collections import deque
+
+from sqlalchemy.sql import text
+
+from helpers.database import async_session_maker
+from settings.config import MESSAGE_STORE_BACKEND, MESSAGE_STORE_MAX_IDS, MESSAGE_STORE_IDLE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryMessageStore:
+    """
+    Хранит ID отправленных ботом сообщений в памяти процесса.
+    На пользователя — кольцевой буфер из `max_ids` последних ID; пользователи,
+    неактивные дольше `idle_ttl` секунд, вытесняются.
+    """
+
+    def __init__(self, max_ids, idle_ttl):
+        self.max_ids = max_ids
+        self.idle_ttl = idle_ttl
+        self._messages = {}  # user_id -> deque(ID сообщений)
+        self._last_seen = {}  # user_id -> время последнего обращения
+
+    def _touch(self, user_id):
+        # Перемещаем пользователя в конец словаря, чтобы в начале всегда были самые давние
+        self._last_seen.pop(user_id, None)
+        self._last_seen[user_id] = time.monotonic()
+
+    async def push(self, user_id, message_id):
+        messages = self._messages.get(user_id)
+        if messages is None:
+            messages = self._messages[user_id] = deque(maxlen=self.max_ids)
+        messages.append(message_id)
+        self._touch(user_id)
+
+    async def pop_last(self, user_id):
+        messages = self._messages.get(user_id)
+        if not messages:
+            return None
+        self._touch(user_id)
+        return messages.pop()
+
+    async def take_all(self, user_id):
+        messages = self._messages.pop(user_id, None)
+        self._last_seen.pop(user_id, None)
+        return list(messages) if messages else []
+
+    async def get_all(self, user_id):
+        return list(self._messages.get(user_id, ()))
+
+    async def evict_idle(self):
+        """Удаляет пользователей, неактивных дольше `idle_ttl`. Возвращает их число."""
+        deadline = time.monotonic() - self.idle_ttl
+        evicted = 0
+        for user_id, last_seen in list(self._last_seen.items()):
+            if last_seen >= deadline:
+                break
+            del self._last_seen[user_id]
+            self._messages.pop(user_id, None)
+            evicted += 1
+        return evicted
+
+    async def stats(self):
+        """Возвращает число пользователей, сообщений и примерный объём занятой памяти в байтах."""
+        ids = sum(len(messages) for messages in self._messages.values())
+        memory = sys.getsizeof(self._messages) + sys.getsizeof(self._last_seen)
+        memory += sum(sys.getsizeof(messages) for messages in self._messages.values())
+        memory += ids * sys.getsizeof(2 ** 40) + len(self._last_seen) * sys.getsizeof(0.0)
+        return {"users": len(self._messages), "messages": ids, "memory_bytes": memory}
+
+
+class SqlMessageStore:
+    """
+    Хранит ID отправленных ботом сообщений в таблице `bot_message_log`.
+    Состояние переживает перезапуск и общее для нескольких процессов бота.
+    """
+
+    def __init__(self, max_ids, idle_ttl):
+        self.max_ids = max_ids
+        self.idle_ttl = idle_ttl
+
+    async def push(self, user_id, message_id):
+        async with async_session_maker() as session:
+            await session.execute(text("""
+            INSERT INTO bot_message_log (user_id, message_id, created_at) VALUES (:user_id, :message_id, NOW())
+            """), {"user_id": user_id, "message_id": message_id})
+            # Оставляем только `max_ids` последних ID пользователя
+            await session.execute(text("""
+            DELETE FROM bot_message_log WHERE id IN (
+                SELECT id FROM bot_message_log WHERE user_id = :user_id ORDER BY id DESC OFFSET :max_ids
+            )
+            """), {"user_id": user_id, "max_ids": self.max_ids})
+            await session.commit()
+
+    async def pop_last(self, user_id):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            DELETE FROM bot_message_log WHERE id = (
+                SELECT id FROM bot_message_log WHERE user_id = :user_id ORDER BY id DESC LIMIT 1
+            )
+            RETURNING message_id
+            """), {"user_id": user_id})
+            message_id = result.scalar()
+            await session.commit()
+            return message_id
+
+    async def take_all(self, user_id):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            DELETE FROM bot_message_log WHERE user_id = :user_id RETURNING id, message_id
+            """), {"user_id": user_id})
+            rows = result.fetchall()
+            await session.commit()
+            return [message_id for _, message_id in sorted(rows)]
+
+    async def get_all(self, user_id):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            SELECT message_id FROM bot_message_log WHERE user_id = :user_id ORDER BY id
+            """), {"user_id": user_id})
+            return list(result.scalars().all())
+
+    async def evict_idle(self):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            DELETE FROM bot_message_log WHERE created_at < NOW() - make_interval(secs => :idle_ttl)
+            """), {"idle_ttl": self.idle_ttl})
+            await session.commit()
+            return result.rowcount
+
+    async def stats(self):
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+            SELECT count(DISTINCT user_id) AS users, count(*) AS messages, pg_total_relation_size('bot_message_log') AS memory_bytes
+            FROM bot_message_log
+            """))
+            return dict(result.mappings().one())
+
+
+MESSAGE_STORE_BACKENDS = {
+    "memory": MemoryMessageStore,
+    "sql": SqlMessageStore,
+}
+
+def create_message_store(backend):
+    """
+    Создаёт хранилище ID сообщений по имени бэкенда из `MESSAGE_STORE_BACKENDS`.
+    """
+    if backend not in MESSAGE_STORE_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд хранилища сообщений: {backend}")
+    return MESSAGE_STORE_BACKENDS[backend](max_ids=MESSAGE_STORE_MAX_IDS, idle_ttl=MESSAGE_STORE_IDLE_TTL)
+
+
+message_store = create_message_store(MESSAGE_STORE_BACKEND)
+
+async def run_message_store_maintenance(interval):
+    """
+    Периодически вытесняет неактивных пользователей из хранилища и пишет в лог его размер.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = await message_store.evict_idle()
+            stats = await message_store.stats()
+            logger.info("Хранилище сообщений: вытеснено %s, сейчас %s", evicted, stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Ошибка обслуживания хранилища сообщений: %s", e)
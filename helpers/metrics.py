@@ -0,0 +1,250 @@
+import os
+import time
+import bisect
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from dotenv import load_dotenv
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+
+# Загружаем `.env`
+load_dotenv()
+
+# Адрес страницы метрик в формате Prometheus (выключена, если порт не задан)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_PATH = "/metrics"
+
+# Границы корзин гистограмм задержки в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Счётчик Prometheus с метками."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}  # значения меток -> счётчик
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками: число наблюдений по корзинам, сумма и количество."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # значения меток -> [счётчики корзин..., сумма, количество]
+
+    def observe(self, value, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1  # Последняя корзина — +Inf
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Набор метрик бота. Кроме счётчиков и гистограмм поддерживает сборщики —
+    функции, которые при каждом запросе страницы возвращают текущие значения (размеры кэшей, пула и т. п.).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []  # (имя, описание, функция -> {метки: значение})
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name, documentation, collect):
+        """Регистрирует gauge `name`, значения которого возвращает `collect()` в виде {(метка, значение)...: число}."""
+        self._collectors.append((name, documentation, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                logger.warning("Ошибка сбора метрики %s: %s", name, e)
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples.items():
+                lines.append(f"{name}{_format_labels((), (), labels)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_latency = registry.histogram("tgshop_handler_duration_seconds", "Время обработки апдейта обработчиком", ("handler",))
+handler_errors = registry.counter("tgshop_handler_errors_total", "Необработанные исключения в обработчиках", ("handler",))
+query_latency = registry.histogram("tgshop_db_query_duration_seconds", "Время выполнения SQL-запроса", ("operation",))
+query_errors = registry.counter("tgshop_db_query_errors_total", "Ошибки SQL-запросов", ("operation",))
+telegram_latency = registry.histogram("tgshop_telegram_request_duration_seconds", "Время запроса к Bot API", ("method", "status"))
+
+
+def handler_name(callback):
+    """Имя обработчика для метрик: модуль без пакета и имя функции, например `cart_handler.view_cart_handler`."""
+    return f"{callback.__module__.rpartition('.')[2]}.{callback.__name__}"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: замеряет время работы каждого обработчика и считает его исключения.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if "button" in data:
+            name = handler_name(data["button"][1])  # Кнопка из таблицы `CallbackRouter`
+        else:
+            name = handler_name(data["handler"].callback) if "handler" in data else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: замеряет время каждого запроса к Bot API по методам.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await make_request(bot, method)
+            status = "ok"
+            return response
+        finally:
+            telegram_latency.observe(time.perf_counter() - started, method.__api_method__, status)
+
+
+def _operation(statement):
+    """Тип SQL-запроса (SELECT, INSERT, ...) для метки метрики."""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def instrument_engine(engine):
+    """
+    Подключает к движку SQLAlchemy замер времени каждого запроса.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        query_latency.observe(time.perf_counter() - started, _operation(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+        query_errors.inc(_operation(exception_context.statement or ""))
+
+
+def flatten_stats(stats, labelnames, base_labels=()):
+    """
+    Превращает (вложенный) словарь статистики в {метки: число} для `MetricsRegistry.collector`.
+    Ключи каждого уровня вложенности становятся меткой с именем из `labelnames`, к ним добавляются `base_labels`.
+    Нечисловые значения пропускаются.
+    """
+    samples = {}
+
+    def walk(values, labels, depth):
+        for key, value in values.items():
+            label = labels + ((labelnames[depth], key),)
+            if isinstance(value, dict):
+                walk(value, label, depth + 1)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                samples[label] = value
+
+    walk(stats, tuple(base_labels), 0)
+    return samples
+
+
+def create_metrics_app():
+    async def metrics_handler(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get(METRICS_PATH, metrics_handler)
+    return app
+
+async def start_metrics_server(worker=0):
+    """
+    Запускает страницу метрик, если задан `METRICS_PORT`. Процесс `worker` слушает порт `METRICS_PORT + worker`.
+    Возвращает `AppRunner` или None.
+    """
+    if not METRICS_PORT:
+        return None
+
+    port = int(METRICS_PORT) + worker
+    runner = web.AppRunner(create_metrics_app())
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+    logger.info("Метрики: http://%s:%s%s", METRICS_HOST, port, METRICS_PATH)
+    return runner
@@ -0,0 +1,49 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from helpers.database import get_user_db_id
+from helpers.logging_setup import log_user_id, log_update_id
+
+logger = logging.getLogger(__name__)
+
+
+class UserIdMiddleware(BaseMiddleware):
+    """
+    Один раз на апдейт определяет `users_botuser.id` пользователя (через LRU-кэш)
+    и передаёт его в обработчики аргументом `user_db_id` (None, если пользователь не зарегистрирован).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        data["user_db_id"] = await get_user_db_id(user.id) if user else None
+        return await handler(event, data)
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: кладёт ID апдейта и пользователя в контекст логирования,
+    чтобы они попадали во все записи лога, сделанные при обработке апдейта.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        update_token = log_update_id.set(getattr(event, "update_id", None))
+        user_token = log_user_id.set(user.id if user else None)
+        try:
+            return await handler(event, data)
+        finally:
+            log_user_id.reset(user_token)
+            log_update_id.reset(update_token)
@@ -1,5 +1,6 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Text, DECIMAL
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Text, DECIMAL, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
 from helpers.database import Base
 from settings.config import MEDIA_URL
 
@@ -41,3 +42,47 @@ class Product(Base):
     price = Column(DECIMAL(10, 2), nullable=False)
     subcategory_id = Column(Integer, ForeignKey("shop_subcategory.id"), nullable=False)
     image = Column(String(255), nullable=False)
+
+
+# Таблицы ниже принадлежат боту (а не Django) и создаются при запуске бота через `init_bot_tables()`
+
+class PendingPayment(Base):
+    __tablename__ = "bot_pending_payment"
+
+    payment_id = Column(String(64), primary_key=True)  # ID платежа в Юкасса
+    order_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)  # `users_botuser.id`
+    telegram_id = Column(BigInteger, nullable=False)
+    amount = Column(DECIMAL(10, 2), nullable=False)
+    status = Column(String(32), nullable=False, default="pending", server_default="pending")  # pending, paid, succeeded, canceled, expired
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    next_check_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class MessageLog(Base):
+    __tablename__ = "bot_message_log"
+    __table_args__ = (Index("bot_message_log_user_id_id_idx", "user_id", "id"),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)  # Telegram ID пользователя (он же ID личного чата)
+    message_id = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+class MediaCacheEntry(Base):
+    __tablename__ = "bot_media_cache"
+
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    image_hash = Column(String(64), nullable=False)  # SHA-1 пути/URL изображения товара
+    file_id = Column(String(255), nullable=False)  # `file_id` фото на серверах Telegram
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class FsmState(Base):
+    __tablename__ = "bot_fsm_state"
+
+    key = Column(String(255), primary_key=True)  # Ключ FSM (бот, чат, пользователь)
+    state = Column(String(255), nullable=True)
+    data = Column(JSONB, nullable=False, server_default="{}")
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+BOT_TABLES = [PendingPayment.__table__, MessageLog.__table__, MediaCacheEntry.__table__, FsmState.__table__]
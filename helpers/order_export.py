@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+
+import openpyxl
+
+from settings.config import ORDERS_FOLDER, ORDER_EXPORT_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+WORKBOOK_HEADER = ["Заказ №", "Пользователь", "Сумма", "Доставка", "Товары", "Дата оплаты"]
+
+
+class OrderExporter:
+    """
+    Выгрузка оплаченных заказов.
+    Каждый заказ сразу дописывается одной строкой в журнал месяца `orders-ГГГГ-ММ.jsonl` (с fsync),
+    а Excel-файл месяца `orders-ГГГГ-ММ.xlsx` фоновый поток пересобирает пачками
+    не чаще раза в `flush_interval` секунд.
+    """
+
+    def __init__(self, folder, flush_interval, build_workbooks=True):
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self.build_workbooks = build_workbooks  # В нескольких процессах Excel должен собирать только один
+        self._queue = queue.Queue()  # Сигнал остановки фонового потока
+        self._lock = threading.Lock()  # Запись в журнал и список месяцев из разных потоков
+        self._thread = None
+        self._workbooks = {}  # месяц -> (книга, сколько байт журнала уже перенесено в книгу)
+        self._watched_months = set()
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.folder, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="order-export", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Сохраняет Excel-файлы и останавливает поток."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def export(self, order_id, user_id, total_amount, delivery_info, cart_items):
+        """
+        Сразу дописывает заказ в журнал и дожидается записи на диск; в Excel он попадёт при ближайшей пересборке.
+        Блокирующий вызов: из цикла событий вызывайте через `asyncio.to_thread`.
+        Ошибка записи пробрасывается, чтобы обработка оплаты повторилась.
+        """
+        self._append_to_journal({
+            "order_id": order_id,
+            "user_id": user_id,
+            "amount": f"{total_amount:.2f}",
+            "delivery_info": delivery_info,
+            "items": [[product_name, quantity] for product_name, quantity in cart_items],
+            "paid_at": datetime.now().isoformat(timespec="seconds"),
+        })
+
+    def _path(self, month, extension):
+        return os.path.join(self.folder, f"orders-{month}.{extension}")
+
+    def _append_to_journal(self, record):
+        month = record["paid_at"][:7]
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self._path(month, "jsonl"), "a", encoding="utf-8") as journal:
+                journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._watched_months.add(month)
+        logger.info("Заказ `%s` записан в журнал заказов за %s.", record['order_id'], month)
+
+    def _sync_workbook(self, month):
+        """
+        Переносит в Excel-книгу месяца новые строки журнала. Возвращает True, если книга изменилась.
+        """
+        journal_path = self._path(month, "jsonl")
+        if not os.path.exists(journal_path):
+            return False
+
+        workbook, offset = self._workbooks.get(month, (None, 0))
+        if os.path.getsize(journal_path) <= offset:
+            return False
+
+        if workbook is None:
+            # Книга всегда строится из журнала, поэтому после перезапуска она пересобирается целиком
+            workbook = openpyxl.Workbook()
+            workbook.active.append(WORKBOOK_HEADER)
+
+        sheet = workbook.active
+        with open(journal_path, "rb") as journal:
+            journal.seek(offset)
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    break  # Строку ещё дописывает другой процесс
+                offset += len(line)
+                record = json.loads(line)
+                items_str = ", ".join(f"{product_name} (x{quantity})" for product_name, quantity in record["items"])
+                sheet.append([record["order_id"], record["user_id"], f"{record['amount']} ₽", record["delivery_info"], items_str, record["paid_at"]])
+
+        workbook_path = self._path(month, "xlsx")
+        temp_path = workbook_path + ".tmp"
+        workbook.save(temp_path)
+        os.replace(temp_path, workbook_path)  # Файл заменяется целиком, поэтому никогда не бывает записан наполовину
+        self._workbooks[month] = (workbook, offset)
+        logger.info("Excel-файл заказов `%s` обновлён.", workbook_path)
+        return True
+
+    def _flush_workbooks(self):
+        current_month = datetime.now().strftime("%Y-%m")
+        with self._lock:
+            self._watched_months.add(current_month)
+            months = sorted(self._watched_months)
+
+        for month in months:
+            try:
+                changed = self._sync_workbook(month)
+            except Exception as e:
+                logger.exception("Ошибка обновления Excel-файла заказов за %s: %s", month, e)
+                continue
+
+            # Прошедший месяц, в который больше ничего не пишут, выгружаем из памяти
+            if month != current_month and not changed:
+                with self._lock:
+                    self._watched_months.discard(month)
+                self._workbooks.pop(month, None)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                stopping = self._queue.get(timeout=max(next_flush - time.monotonic(), 0)) is None
+            except queue.Empty:
+                stopping = False
+
+            # Excel пересобирается пачкой не чаще раза в `flush_interval` секунд и при остановке
+            if self.build_workbooks:
+                self._flush_workbooks()
+            next_flush = time.monotonic() + self.flush_interval
+
+            if stopping:
+                break
+
+
+order_exporter = OrderExporter(folder=ORDERS_FOLDER, flush_interval=ORDER_EXPORT_FLUSH_INTERVAL)
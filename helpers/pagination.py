@@ -0,0 +1,28 @@
+from aiogram import types
+
+
+def page_navigation(callback_data, page, items, has_more, before):
+    """
+    Строит кнопки "⬅️ Назад" и "➡️ Вперёд" по результату `seek_page`.
+    `callback_data` — данные текущей страницы (`CategoriesCallback`, `ProductsCallback` и т. п.),
+    в кнопках меняются только номер страницы и курсор.
+    Кнопка показывается, только если в её направлении действительно есть строки.
+    Возвращает (кнопки, уточнённый номер страницы). Для пустой страницы кнопок нет.
+    """
+    if not items:
+        return [], page  # Строки страницы могли удалить между нажатиями: курсоров для кнопок нет
+
+    # При листании назад следующая страница есть всегда, а предыдущая — если проба нашла ещё строки
+    has_previous = has_more if before is not None else page > 1
+    has_next = has_more if before is None else True
+    if not has_previous:
+        page = 1  # Номер страницы мог сбиться, если строки удаляли, пока пользователь листал
+
+    buttons = []
+    if has_previous:
+        previous_page = callback_data.model_copy(update={"page": page - 1, "after": None, "before": items[0].id})
+        buttons.append(types.InlineKeyboardButton(text="⬅️ Назад", callback_data=previous_page.pack()))
+    if has_next:
+        next_page = callback_data.model_copy(update={"page": page + 1, "after": items[-1].id, "before": None})
+        buttons.append(types.InlineKeyboardButton(text="➡️ Вперёд", callback_data=next_page.pack()))
+    return buttons, page
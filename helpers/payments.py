@@ -0,0 +1,291 @@
+import os
+import asyncio
+import logging
+
+from aiohttp import web
+from dotenv import load_dotenv
+from sqlalchemy.sql import text
+
+from helpers.database import async_session_maker
+from helpers.yookassa_gateway import YooKassaGateway
+from settings.config import (
+    PAYMENT_POLL_INTERVAL, PAYMENT_CHECK_INTERVAL, PAYMENT_CHECK_MAX_INTERVAL, PAYMENT_EXPIRY, PAYMENT_BATCH_SIZE,
+    YOOKASSA_TIMEOUT, YOOKASSA_CONNECT_TIMEOUT, YOOKASSA_RETRIES, YOOKASSA_POOL_SIZE,
+)
+
+# Загружаем `.env`
+load_dotenv()
+
+# Подключаем Юкассу
+YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID")
+YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY")
+YOOKASSA_RETURN_URL = os.getenv("YOOKASSA_RETURN_URL")
+YOOKASSA_API_URL = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3/")  # Можно указать локальный тестовый сервер
+
+# Приём HTTP-уведомлений Юкасса (включается, если задан порт)
+YOOKASSA_WEBHOOK_HOST = os.getenv("YOOKASSA_WEBHOOK_HOST", "0.0.0.0")
+YOOKASSA_WEBHOOK_PORT = os.getenv("YOOKASSA_WEBHOOK_PORT")
+YOOKASSA_WEBHOOK_PATH = os.getenv("YOOKASSA_WEBHOOK_PATH", "/yookassa/webhook")
+
+logger = logging.getLogger(__name__)
+
+# Асинхронный клиент Юкасса с общим пулом соединений
+yookassa = YooKassaGateway(
+    shop_id=YOOKASSA_SHOP_ID,
+    secret_key=YOOKASSA_SECRET_KEY,
+    base_url=YOOKASSA_API_URL,
+    timeout=YOOKASSA_TIMEOUT,
+    connect_timeout=YOOKASSA_CONNECT_TIMEOUT,
+    retries=YOOKASSA_RETRIES,
+    pool_size=YOOKASSA_POOL_SIZE,
+)
+
+# Сколько секунд платёж считается занятым одним обработчиком (защита от двойной проверки несколькими процессами)
+CLAIM_LEASE = 60
+
+# Фоновые задачи обработки уведомлений, чтобы их не удалил сборщик мусора
+_background_tasks = set()
+
+async def register_pending_payment(payment_id, order_id, user_db_id, telegram_id, amount):
+    """
+    Сохраняет платёж в таблицу ожидающих оплаты. Дальше его статус отслеживает сверка платежей.
+    """
+    async with async_session_maker() as session:
+        await session.execute(text("""
+        INSERT INTO bot_pending_payment (payment_id, order_id, user_id, telegram_id, amount, next_check_at)
+        VALUES (:payment_id, :order_id, :user_id, :telegram_id, :amount, NOW() + make_interval(secs => :delay))
+        ON CONFLICT (payment_id) DO NOTHING
+        """), {
+            "payment_id": payment_id, "order_id": order_id, "user_id": user_db_id,
+            "telegram_id": telegram_id, "amount": amount, "delay": PAYMENT_CHECK_INTERVAL,
+        })
+        await session.commit()
+    logger.info("Платёж `%s` заказа `%s` поставлен на отслеживание.", payment_id, order_id)
+
+async def create_payment(amount, description, idempotence_key):
+    """
+    Создаёт платёж в Юкасса. Возвращает пару (ID платежа, ссылка на оплату).
+    """
+    payment = await yookassa.create_payment({
+        "amount": {"value": f"{amount:.2f}", "currency": "RUB"},
+        "confirmation": {"type": "redirect", "return_url": YOOKASSA_RETURN_URL},
+        "capture": True,
+        "description": description
+    }, idempotence_key)
+    return payment["id"], payment["confirmation"]["confirmation_url"]
+
+async def fetch_payment_status(payment_id):
+    """
+    Запрашивает статус платежа в Юкасса.
+    """
+    payment = await yookassa.get_payment(payment_id)
+    return payment["status"]
+
+async def claim_due_payments(limit):
+    """
+    Выбирает платежи, которые пора проверить (или оплаченные, обработку которых нужно повторить),
+    и продлевает им срок следующей проверки, чтобы другие процессы бота не взяли их одновременно.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(text("""
+        UPDATE bot_pending_payment SET next_check_at = NOW() + make_interval(secs => :lease)
+        WHERE payment_id IN (
+            SELECT payment_id FROM bot_pending_payment
+            WHERE status IN ('pending', 'paid') AND next_check_at <= NOW()
+            ORDER BY next_check_at
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING payment_id, order_id, user_id, telegram_id, amount, attempts, created_at, status
+        """), {"lease": CLAIM_LEASE, "limit": limit})
+        payments = result.fetchall()
+        await session.commit()
+        return payments
+
+async def finish_payment(payment_id, status):
+    """
+    Переводит ожидающий платёж в конечный статус (например, `canceled`). Возвращает строку платежа,
+    только если статус изменил именно этот вызов.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(text("""
+        UPDATE bot_pending_payment SET status = :status, finished_at = NOW()
+        WHERE payment_id = :payment_id AND status = 'pending'
+        RETURNING payment_id, order_id, user_id, telegram_id, amount, attempts, created_at
+        """), {"payment_id": payment_id, "status": status})
+        payment = result.fetchone()
+        await session.commit()
+        return payment
+
+async def mark_payment_paid(payment_id):
+    """
+    Отмечает платёж оплаченным, но ещё не обработанным (`paid`). Возвращает строку платежа, только если
+    статус изменил именно этот вызов. Пока обработка не завершена, сверка повторяет её через `CLAIM_LEASE` секунд.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(text("""
+        UPDATE bot_pending_payment SET status = 'paid', next_check_at = NOW() + make_interval(secs => :lease)
+        WHERE payment_id = :payment_id AND status = 'pending'
+        RETURNING payment_id, order_id, user_id, telegram_id, amount, attempts, created_at, status
+        """), {"payment_id": payment_id, "lease": CLAIM_LEASE})
+        payment = result.fetchone()
+        await session.commit()
+        return payment
+
+async def complete_paid_payment(bot, payment, on_succeeded):
+    """
+    Обрабатывает оплаченный платёж через `on_succeeded` и только после этого переводит его в `succeeded`.
+    Если обработка упала (или процесс завершился), платёж остаётся `paid` и сверка повторит её.
+    """
+    await on_succeeded(bot, payment)
+    async with async_session_maker() as session:
+        await session.execute(text("""
+        UPDATE bot_pending_payment SET status = 'succeeded', finished_at = NOW()
+        WHERE payment_id = :payment_id AND status = 'paid'
+        """), {"payment_id": payment.payment_id})
+        await session.commit()
+    logger.info("Оплата заказа `%s` обработана для пользователя `%s`.", payment.order_id, payment.telegram_id)
+
+async def postpone_payment(payment):
+    """
+    Откладывает следующую проверку платежа с экспоненциальной задержкой
+    или помечает платёж просроченным, если он ждёт оплаты дольше `PAYMENT_EXPIRY`.
+    """
+    delay = min(PAYMENT_CHECK_INTERVAL * 2 ** payment.attempts, PAYMENT_CHECK_MAX_INTERVAL)
+    async with async_session_maker() as session:
+        result = await session.execute(text("""
+        UPDATE bot_pending_payment
+        SET attempts = attempts + 1,
+            next_check_at = NOW() + make_interval(secs => :delay),
+            status = CASE WHEN created_at < NOW() - make_interval(secs => :expiry) THEN 'expired' ELSE status END,
+            finished_at = CASE WHEN created_at < NOW() - make_interval(secs => :expiry) THEN NOW() ELSE finished_at END
+        WHERE payment_id = :payment_id AND status = 'pending'
+        RETURNING status
+        """), {"payment_id": payment.payment_id, "delay": delay, "expiry": PAYMENT_EXPIRY})
+        status = result.scalar()
+        await session.commit()
+
+    if status == "expired":
+        logger.warning("Платёж `%s` заказа `%s` не оплачен вовремя и снят с отслеживания.", payment.payment_id, payment.order_id)
+
+async def apply_payment_status(bot, payment, status, on_succeeded):
+    """
+    Обрабатывает полученный из Юкасса статус платежа.
+    """
+    if status == "succeeded":
+        paid = await mark_payment_paid(payment.payment_id)
+        if paid:
+            logger.info("Оплата заказа `%s` успешно завершена для пользователя `%s`.", paid.order_id, paid.telegram_id)
+            await complete_paid_payment(bot, paid, on_succeeded)
+    elif status == "canceled":
+        if await finish_payment(payment.payment_id, "canceled"):
+            logger.info("Платёж `%s` заказа `%s` отменён.", payment.payment_id, payment.order_id)
+    else:
+        await postpone_payment(payment)
+
+async def check_payment(bot, payment, on_succeeded):
+    """
+    Проверяет один платёж. Ошибки сети и API приводят лишь к отложенной повторной проверке.
+    Для уже оплаченного платежа (`paid`) статус не запрашивается, повторяется только его обработка.
+    """
+    if payment.status == "paid":
+        try:
+            await complete_paid_payment(bot, payment, on_succeeded)
+        except Exception as e:
+            logger.exception("Повторная обработка оплаченного платежа `%s` не удалась: %s", payment.payment_id, e)
+        return
+
+    try:
+        status = await fetch_payment_status(payment.payment_id)
+    except Exception as e:
+        logger.warning("Не удалось получить статус платежа `%s`: %s", payment.payment_id, e)
+        await postpone_payment(payment)
+        return
+
+    try:
+        await apply_payment_status(bot, payment, status, on_succeeded)
+    except Exception as e:
+        logger.exception("Ошибка обработки платежа `%s`: %s", payment.payment_id, e)
+
+async def reconcile_payments(bot, on_succeeded):
+    """
+    Проверяет одну партию платежей, которым подошёл срок проверки. Возвращает размер партии.
+    """
+    payments = await claim_due_payments(PAYMENT_BATCH_SIZE)
+    if payments:
+        logger.info("Сверка платежей: проверяем %s шт.", len(payments))
+        await asyncio.gather(*(check_payment(bot, payment, on_succeeded) for payment in payments))
+    return len(payments)
+
+async def run_payment_reconciler(bot, on_succeeded):
+    """
+    Фоновая сверка всех ожидающих оплаты платежей.
+    `on_succeeded(bot, payment)` вызывается для каждого оплаченного платежа, пока не завершится без ошибки.
+    """
+    logger.info("Сверка платежей запущена")
+    while True:
+        try:
+            checked = await reconcile_payments(bot, on_succeeded)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Ошибка сверки платежей: %s", e)
+            checked = 0
+
+        # Если партия была полной, сразу берём следующую
+        if checked < PAYMENT_BATCH_SIZE:
+            await asyncio.sleep(PAYMENT_POLL_INTERVAL)
+
+async def _handle_notification(bot, payment_id, on_succeeded):
+    """
+    Проверяет платёж из уведомления. Статус повторно запрашивается у Юкасса,
+    поэтому содержимому уведомления доверять не нужно.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(text("""
+        SELECT payment_id, order_id, user_id, telegram_id, amount, attempts, created_at, status
+        FROM bot_pending_payment WHERE payment_id = :payment_id AND status = 'pending'
+        """), {"payment_id": payment_id})
+        payment = result.fetchone()
+
+    if payment is None:
+        logger.info("Уведомление по неизвестному или уже обработанному платежу `%s` пропущено.", payment_id)
+        return
+
+    await check_payment(bot, payment, on_succeeded)
+
+def create_payment_webhook_app(bot, on_succeeded):
+    """
+    Создаёт aiohttp-приложение, принимающее HTTP-уведомления Юкасса о смене статуса платежа.
+    """
+    async def notification_handler(request):
+        try:
+            data = await request.json()
+            payment_id = data["object"]["id"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Получено некорректное уведомление Юкасса")
+            return web.Response(status=400)
+
+        logger.info("Уведомление Юкасса `%s` по платежу `%s`", data.get('event'), payment_id)
+        task = asyncio.create_task(_handle_notification(bot, payment_id, on_succeeded))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(YOOKASSA_WEBHOOK_PATH, notification_handler)
+    return app
+
+async def start_payment_webhook(bot, on_succeeded):
+    """
+    Запускает приём уведомлений Юкасса, если задан `YOOKASSA_WEBHOOK_PORT`. Возвращает `AppRunner` или None.
+    """
+    if not YOOKASSA_WEBHOOK_PORT:
+        return None
+
+    runner = web.AppRunner(create_payment_webhook_app(bot, on_succeeded))
+    await runner.setup()
+    site = web.TCPSite(runner, YOOKASSA_WEBHOOK_HOST, int(YOOKASSA_WEBHOOK_PORT))
+    await site.start()
+    logger.info("Приём уведомлений Юкасса: http://%s:%s%s", YOOKASSA_WEBHOOK_HOST, YOOKASSA_WEBHOOK_PORT, YOOKASSA_WEBHOOK_PATH)
+    return runner
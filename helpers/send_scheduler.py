@@ -0,0 +1,226 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from settings.config import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST,
+    SEND_CHAT_BUCKETS_MAX, SEND_RETRY_AFTER_ATTEMPTS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: чем меньше число, тем раньше запрос получает глобальный лимит
+PRIORITY_INTERACTIVE = 0  # Ответы пользователю на его действия
+PRIORITY_BACKGROUND = 1  # Фоновые уведомления (например, об оплате)
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+send_priority = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+# Методы, которые создают сообщения в чате: ограничиваются и по чату, и глобально
+CHAT_LIMITED_METHODS = {"copyMessage", "copyMessages", "forwardMessage", "forwardMessages"}
+# Методы, которые меняют существующие сообщения: ограничиваются только глобально
+GLOBAL_LIMITED_PREFIXES = ("edit", "delete")
+
+
+@contextmanager
+def background_sends():
+    """
+    Запросы к Telegram внутри блока получают фоновый приоритет и пропускают вперёд ответы пользователям.
+    """
+    token = send_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Корзина токенов: `rate` токенов в секунду, не больше `burst` про запас.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # До этого момента Telegram попросил не отправлять (`retry_after`)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        """
+        Забирает токен, если он есть, и возвращает 0; иначе возвращает, сколько секунд ждать следующего.
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def reserve(self):
+        """
+        Забирает токен в долг и возвращает, сколько секунд ждать до его появления.
+        Запросы одного чата так обслуживаются строго по очереди.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self):
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.burst and now >= self.blocked_until
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Telegram, подключается к сессии бота: `bot.session.middleware(...)`.
+    Отправка сообщений ограничивается корзиной токенов чата и общей корзиной бота,
+    изменение и удаление сообщений — только общей (но ждут, пока чат приостановлен). Ожидающие общего лимита запросы
+    обслуживаются по приоритету (`send_priority`), а ответ 429 с `retry_after`
+    приостанавливает чат и запрос повторяется.
+    """
+
+    def __init__(self, global_rate, global_burst, chat_rate, chat_burst, max_chat_buckets, retry_attempts):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chat_buckets = max_chat_buckets
+        self.retry_attempts = retry_attempts
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = OrderedDict()  # chat_id -> TokenBucket, в начале самые давние
+        self._waiting = []  # Куча (приоритет, порядковый номер, future) ожидающих общего лимита
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._pump_task = None
+        self._chat_waiting = 0
+        self.metrics = {"requests": 0, "delayed": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "retry_after": 0, "failed_retry_after": 0}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.pop(chat_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            # Вытесняем самые давние корзины, которые уже полностью восстановились
+            while len(self._chats) >= self.max_chat_buckets:
+                oldest_chat_id, oldest = next(iter(self._chats.items()))
+                if not oldest.is_idle():
+                    break
+                del self._chats[oldest_chat_id]
+        self._chats[chat_id] = bucket
+        return bucket
+
+    async def _pump(self):
+        """Выдаёт общий лимит ожидающим запросам в порядке приоритета."""
+        while True:
+            while self._waiting and self._waiting[0][2].done():
+                heapq.heappop(self._waiting)  # Запрос отменили, пока он ждал
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._global.try_take()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                self._global.tokens += 1  # Токен не понадобился
+            else:
+                future.set_result(None)
+
+    async def _acquire_global(self, priority):
+        # Быстрый путь: очереди нет и токен есть
+        if not self._waiting and not self._global.try_take():
+            return
+
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    async def _acquire(self, method):
+        api_method = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        chat_limited = chat_id is not None and (
+            (api_method.startswith("send") and api_method != "sendChatAction") or api_method in CHAT_LIMITED_METHODS
+        )
+        if not chat_limited and not api_method.startswith(GLOBAL_LIMITED_PREFIXES):
+            return None  # Служебные методы (ответы на callback, inline-запросы и т. п.) не ограничиваем
+
+        started = time.monotonic()
+        bucket = None
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            # Изменение и удаление не расходуют токены чата, но ждут окончания его `retry_after`
+            delay = bucket.reserve() if chat_limited else bucket.blocked_until - started
+            if delay > 0:
+                self._chat_waiting += 1
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    self._chat_waiting -= 1
+
+        await self._acquire_global(send_priority.get())
+
+        waited = time.monotonic() - started
+        self.metrics["requests"] += 1
+        if waited > 0.001:
+            self.metrics["delayed"] += 1
+            self.metrics["wait_seconds"] += waited
+            self.metrics["max_wait_seconds"] = max(self.metrics["max_wait_seconds"], waited)
+        return bucket
+
+    async def __call__(self, make_request, bot, method):
+        for attempt in range(self.retry_attempts + 1):
+            bucket = await self._acquire(method)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.metrics["retry_after"] += 1
+                if attempt == self.retry_attempts:
+                    self.metrics["failed_retry_after"] += 1
+                    raise
+                logger.warning("Telegram ограничил частоту `%s` на %s с., повторяем запрос.", method.__api_method__, e.retry_after)
+                # Приостанавливаем чат (или всю отправку, если запрос не относится к чату) до окончания `retry_after`
+                (bucket or self._global).block(e.retry_after)
+
+    def stats(self):
+        """Возвращает длину очередей по приоритетам и счётчики задержек."""
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiting:
+            if not future.done():
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {"queued": queued, "chat_waiting": self._chat_waiting, "chats": len(self._chats), **self.metrics}
+
+
+send_scheduler = SendScheduler(
+    global_rate=SEND_GLOBAL_RATE,
+    global_burst=SEND_GLOBAL_BURST,
+    chat_rate=SEND_CHAT_RATE,
+    chat_burst=SEND_CHAT_BURST,
+    max_chat_buckets=SEND_CHAT_BUCKETS_MAX,
+    retry_attempts=SEND_RETRY_AFTER_ATTEMPTS,
+)
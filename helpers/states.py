@@ -0,0 +1,12 @@
+from aiogram.fsm.state import State, StatesGroup
+
+
+class CartStates(StatesGroup):
+    """Ввод количества товара."""
+    add_quantity = State()  # Количество для добавления в корзину (данные: product_id, product_name, quantity)
+    update_quantity = State()  # Новое количество товара в корзине (данные: product_id, product_name)
+
+
+class OrderStates(StatesGroup):
+    """Оформление заказа."""
+    delivery_info = State()  # Ввод данных для доставки
@@ -1,38 +1,84 @@
-import os
+import time
+import asyncio
 import logging
-import aiohttp
 
-from dotenv import load_dotenv
-from aiogram import types
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
 
-from settings.config import GROUP_ID, CHANNEL_ID
+from settings.config import (
+    GROUP_ID, CHANNEL_ID,
+    SUBSCRIPTION_CACHE_POSITIVE_TTL, SUBSCRIPTION_CACHE_NEGATIVE_TTL, SUBSCRIPTION_CACHE_MAX_SIZE,
+)
 
 logger = logging.getLogger(__name__)  # Создаём логгер
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
 
-async def check_subscription(user_id):
+# Кэш результатов проверки подписки: user_id -> (подписан ли, момент истечения записи)
+subscription_cache = {}
+
+# Проверки, которые выполняются прямо сейчас: user_id -> asyncio.Task
+_pending_checks = {}
+
+def _cache_subscription(user_id, is_subscribed):
+    """
+    Сохраняет результат проверки подписки с отдельным TTL для положительного и отрицательного ответа.
+    """
+    ttl = SUBSCRIPTION_CACHE_POSITIVE_TTL if is_subscribed else SUBSCRIPTION_CACHE_NEGATIVE_TTL
+    subscription_cache.pop(user_id, None)
+    subscription_cache[user_id] = (is_subscribed, time.monotonic() + ttl)
+
+    if len(subscription_cache) > SUBSCRIPTION_CACHE_MAX_SIZE:
+        # Сначала убираем просроченные записи, затем самые старые
+        now = time.monotonic()
+        for cached_user_id in [uid for uid, (_, expires_at) in subscription_cache.items() if expires_at < now]:
+            del subscription_cache[cached_user_id]
+        while len(subscription_cache) > SUBSCRIPTION_CACHE_MAX_SIZE:
+            del subscription_cache[next(iter(subscription_cache))]
+
+async def _is_member(bot: Bot, chat_id, user_id):
+    """
+    Проверяет, состоит ли пользователь в чате, через сессию бота.
+    """
+    member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+    return member.status not in ("left", "kicked") and getattr(member, "is_member", True)
+
+async def _fetch_subscription(bot: Bot, user_id):
+    """
+    Параллельно проверяет подписку на группу и канал и кэширует результат.
+    Ошибки API не кэшируются.
+    """
+    try:
+        results = await asyncio.gather(*(_is_member(bot, chat_id, user_id) for chat_id in (GROUP_ID, CHANNEL_ID)))
+    except TelegramAPIError as e:
+        logger.warning("Ошибка проверки подписки пользователя %s: %s", user_id, e)
+        return False  # Ошибка API - считаем, что не подписан
+
+    is_subscribed = all(results)
+    _cache_subscription(user_id, is_subscribed)
+    logger.info("Подписка пользователя %s: %s", user_id, is_subscribed)
+    return is_subscribed
+
+async def check_subscription(bot: Bot, user_id, recheck_negative=False):
     """
     Проверяет, подписан ли пользователь на канал и группу.
-    
+
     Аргументы:
+        bot (Bot): Экземпляр бота, сессия которого используется для запросов.
         user_id (int): Telegram ID пользователя.
+        recheck_negative (bool): Не доверять закэшированному отрицательному результату
+            (например, после /start, когда пользователь мог только что подписаться).
 
     Возвращает:
         bool: True, если подписан. False, если нет.
     """
-    async with aiohttp.ClientSession() as session:
-        for chat_id in [GROUP_ID, CHANNEL_ID]:
-            url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember?chat_id={chat_id}&user_id={user_id}"
-            async with session.get(url) as response:
-                data = await response.json()
-                logger.info(f"Ответ API для {chat_id}: {data}")  # Логируем ответ API
-
-                if not data["ok"]:
-                    return False  # Ошибка API - считаем, что не подписан
-                
-                status = data["result"]["status"]
-                if status in ["left", "kicked"]:
-                    return False  # Пользователь НЕ подписан
-    
-    return True  # Пользователь подписан на канал и группу
+    cached = subscription_cache.get(user_id)
+    if cached and cached[1] > time.monotonic() and (cached[0] or not recheck_negative):
+        return cached[0]
+
+    # Одновременные проверки одного пользователя объединяются в один запрос
+    task = _pending_checks.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_subscription(bot, user_id))
+        _pending_checks[user_id] = task
+        task.add_done_callback(lambda _: _pending_checks.pop(user_id, None))
+
+    return await asyncio.shield(task)
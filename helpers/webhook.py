@@ -0,0 +1,63 @@
+import os
+import logging
+
+from aiohttp import web
+from dotenv import load_dotenv
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+# Загружаем `.env`
+load_dotenv()
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Приём обновлений Telegram через webhook (за nginx)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Telegram передаёт его в заголовке `X-Telegram-Bot-Api-Secret-Token`
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))  # Число процессов, принимающих обновления на одном порту
+
+HEALTH_PATH = "/healthz"
+
+logger = logging.getLogger(__name__)
+
+def create_webhook_app(dispatcher, bot, worker):
+    """
+    Создаёт aiohttp-приложение, принимающее обновления Telegram.
+    Запросы без верного секретного токена отклоняются с кодом 401. Telegram сразу получает
+    ответ 200, а обновление обрабатывается в фоне.
+    """
+    async def health_handler(request):
+        return web.json_response({"status": "ok", "worker": worker})
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get(HEALTH_PATH, health_handler)
+    return app
+
+async def start_webhook_server(dispatcher, bot, worker):
+    """
+    Запускает приём обновлений на `WEBAPP_HOST:WEBAPP_PORT`. Возвращает `AppRunner`.
+    При нескольких процессах все они слушают один порт (`SO_REUSEPORT`), и ядро распределяет соединения между ними.
+    """
+    runner = web.AppRunner(create_webhook_app(dispatcher, bot, worker))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT, reuse_port=WEB_WORKERS > 1)
+    await site.start()
+    logger.info("Процесс %s: приём обновлений Telegram на http://%s:%s%s", worker, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+    return runner
+
+async def set_bot_webhook(bot, allowed_updates):
+    """
+    Регистрирует webhook в Telegram.
+    """
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    await bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET, allowed_updates=allowed_updates)
+    logger.info("Webhook установлен: %s", url)
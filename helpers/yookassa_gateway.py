@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Статусы ответа, при которых запрос можно безопасно повторить с тем же ключом идемпотентности
+RETRY_STATUSES = {202, 429, 500, 502, 503, 504}
+
+
+class YooKassaError(Exception):
+    """
+    Ошибка API Юкасса, которую бессмысленно повторять (неверные данные, авторизация и т.п.).
+    """
+
+    def __init__(self, status, data):
+        super().__init__(f"Юкасса вернула {status}: {data}")
+        self.status = status
+        self.data = data
+
+
+class YooKassaGateway:
+    """
+    Асинхронный клиент API Юкасса.
+    Держит пул keep-alive соединений, ограничивает время запросов, повторяет
+    неудачные запросы с тем же ключом идемпотентности и собирает метрики задержек.
+    """
+
+    def __init__(self, shop_id, secret_key, base_url, timeout=10, connect_timeout=3, retries=3, pool_size=20):
+        self.shop_id = shop_id
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.pool_size = pool_size
+        self.metrics = {}  # операция -> счётчики запросов и задержек
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url,
+                auth=aiohttp.BasicAuth(str(self.shop_id), str(self.secret_key)),
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            )
+        return self._session
+
+    def _record(self, operation, elapsed, ok, retries):
+        stats = self.metrics.setdefault(operation, {"count": 0, "errors": 0, "retries": 0, "total_time": 0.0, "max_time": 0.0})
+        stats["count"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["retries"] += retries
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+
+    async def _request(self, operation, method, path, json=None, idempotence_key=None):
+        """
+        Выполняет запрос к API. Сетевые ошибки, таймауты и ответы 202/429/5xx
+        повторяются с экспоненциальной задержкой; ключ идемпотентности при повторе не меняется.
+        """
+        headers = {"Idempotence-Key": idempotence_key} if idempotence_key else {}
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            delay = 0.5 * 2 ** attempt
+            try:
+                async with self._get_session().request(method, path, json=json, headers=headers) as response:
+                    try:
+                        data = await response.json(content_type=None)
+                    except ValueError:
+                        data = None  # Тело не JSON (например, HTML-страница 502 от прокси); решаем по статусу
+                    if response.status == 200 and data is not None:
+                        self._record(operation, time.monotonic() - started, True, attempt)
+                        return data
+                    if response.status not in RETRY_STATUSES:
+                        raise YooKassaError(response.status, data)
+                    if isinstance(data, dict) and data.get("retry_after"):
+                        delay = data["retry_after"] / 1000  # Юкасса присылает задержку в миллисекундах
+                    error = YooKassaError(response.status, data)
+            except YooKassaError:
+                self._record(operation, time.monotonic() - started, False, attempt)
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            if attempt >= self.retries:
+                self._record(operation, time.monotonic() - started, False, attempt)
+                raise error
+
+            attempt += 1
+            logger.warning("Запрос Юкасса `%s` не удался (%r), повтор %s из %s через %.1f с", operation, error, attempt, self.retries, delay)
+            await asyncio.sleep(delay)
+
+    async def create_payment(self, payload, idempotence_key):
+        """
+        Создаёт платёж. Возвращает объект платежа (dict) из ответа API.
+        """
+        return await self._request("create_payment", "POST", "payments", json=payload, idempotence_key=idempotence_key)
+
+    async def get_payment(self, payment_id):
+        """
+        Возвращает объект платежа (dict) по его ID.
+        """
+        return await self._request("get_payment", "GET", f"payments/{payment_id}")
+
+    def stats(self):
+        """Возвращает метрики запросов с расчётом средней задержки."""
+        return {
+            operation: {**stats, "avg_time": stats["total_time"] / stats["count"] if stats["count"] else 0.0}
+            for operation, stats in self.metrics.items()
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -6,6 +6,11 @@ TG_GROUP_URL = "https://t.me/+n-qLN2T8xCZlOTEy"
 GROUP_ID = "-4844064739"
 CHANNEL_ID = "-1002344931960"
 
+# Кэш проверки подписки
+SUBSCRIPTION_CACHE_POSITIVE_TTL = 600  # Сколько секунд доверять тому, что пользователь подписан
+SUBSCRIPTION_CACHE_NEGATIVE_TTL = 30  # Сколько секунд доверять тому, что пользователь не подписан
+SUBSCRIPTION_CACHE_MAX_SIZE = 100_000  # Максимальное число пользователей в кэше
+
 # Настройка каталога категорий
 CATEGORIES_PER_PAGE = 3  # Число категорий на одной странице
 
@@ -15,3 +20,64 @@ SUBCATEGORIES_PER_PAGE = 3  # Число подкатегорий на одно
 # Настройка вывода товаров
 PRODUCTS_PER_PAGE = 3  # Количество товаров на одной странице
 MEDIA_URL = "http://yourserver.com/media/"  # URL доступа к файлам media из Django для вывода изображений товаров
+PRODUCT_RENDER_MODE = "cards"  # "cards" — каждый товар отдельным фото с кнопкой, "album" — страница одним альбомом и одним сообщением с кнопками
+
+# Настройка корзины
+CART_VIEW_MODE = "cards"  # "cards" — каждая позиция отдельным фото, "compact" — вся корзина одним сообщением, которое меняется на месте
+CART_ITEMS_PER_PAGE = 8  # Сколько позиций показывать на одной странице компактной корзины
+
+# Настройка кэша каталога (категории, подкатегории, товары)
+CATALOG_CACHE_TTL = 300  # Время жизни записи в кэше в секундах (страховка на случай пропуска уведомлений из БД)
+CATALOG_CACHE_MAX_SIZE = 1000  # Максимальное число записей в кэше
+
+# Настройка поиска по FAQ
+FAQ_INDEX_TTL = 600  # Через сколько секунд индекс FAQ перестраивается, даже если уведомлений об изменениях не было
+
+# Настройка сверки платежей Юкасса
+PAYMENT_POLL_INTERVAL = 5  # Как часто (в секундах) искать платежи, которым пора проверить статус
+PAYMENT_CHECK_INTERVAL = 10  # Задержка первой проверки платежа; далее она удваивается
+PAYMENT_CHECK_MAX_INTERVAL = 300  # Максимальная задержка между проверками одного платежа
+PAYMENT_EXPIRY = 86_400  # Через сколько секунд неоплаченный платёж снимается с отслеживания
+PAYMENT_BATCH_SIZE = 50  # Сколько платежей проверять за один проход
+
+# Настройка клиента API Юкасса
+YOOKASSA_TIMEOUT = 10  # Общий таймаут запроса в секундах
+YOOKASSA_CONNECT_TIMEOUT = 3  # Таймаут установки соединения в секундах
+YOOKASSA_RETRIES = 3  # Число повторов при сетевых ошибках и ответах 202/429/5xx
+YOOKASSA_POOL_SIZE = 20  # Максимум одновременных соединений с Юкасса
+
+# Настройка выгрузки заказов
+ORDERS_FOLDER = "orders"  # Папка для журналов заказов (orders-ГГГГ-ММ.jsonl) и Excel-файлов (orders-ГГГГ-ММ.xlsx)
+ORDER_EXPORT_FLUSH_INTERVAL = 30  # Как часто (в секундах) новые заказы переносятся из журнала в Excel
+
+# Кэш соответствия Telegram ID -> ID пользователя в БД
+USER_ID_CACHE_SIZE = 100_000  # Максимальное число пользователей в кэше
+USER_ID_CACHE_TTL = 86_400  # Время жизни записи в секундах
+USER_ID_NEGATIVE_TTL = 60  # Сколько секунд помнить, что пользователь не зарегистрирован
+
+# Кэш пользователей, уже сохранённых в БД: повторный /start с тем же профилем не обращается к БД
+SEEN_USER_CACHE_SIZE = 100_000  # Максимальное число пользователей в кэше
+SEEN_USER_CACHE_TTL = 86_400  # Через сколько секунд профиль пользователя сверяется с БД заново
+
+# Хранилище ID отправленных ботом сообщений (для их последующего удаления)
+MESSAGE_STORE_BACKEND = "memory"  # "memory" — в памяти процесса, "sql" — в таблице bot_message_log (общее для нескольких процессов)
+MESSAGE_STORE_MAX_IDS = 50  # Сколько последних ID хранить на пользователя
+MESSAGE_STORE_IDLE_TTL = 172_800  # Через сколько секунд бездействия забывать пользователя (старше 48 ч сообщения уже не удалить)
+MESSAGE_STORE_EVICT_INTERVAL = 600  # Как часто (в секундах) вытеснять неактивных пользователей
+
+# Удаление старых сообщений бота
+CLEANUP_IN_BACKGROUND = True  # Удалять старые сообщения в фоне, не задерживая отправку новых
+CLEANUP_CONCURRENCY = 5  # Сколько одиночных удалений выполнять одновременно, если пакетное удаление недоступно
+
+# Планировщик исходящих запросов к Telegram
+SEND_GLOBAL_RATE = 30  # Сколько сообщений в секунду бот отправляет всего (лимит Telegram ~30/с)
+SEND_GLOBAL_BURST = 30  # Сколько сообщений можно отправить разом сверх средней скорости
+SEND_CHAT_RATE = 1  # Сколько сообщений в секунду отправляется в один чат (лимит Telegram ~1/с)
+SEND_CHAT_BURST = 5  # Сколько сообщений можно отправить в чат разом (например, страница товаров)
+SEND_CHAT_BUCKETS_MAX = 100_000  # Сколько чатов отслеживать одновременно
+SEND_RETRY_AFTER_ATTEMPTS = 3  # Сколько раз повторять запрос после ответа 429 с `retry_after`
+
+# Хранилище состояний диалогов (FSM): ввод количества товара, данных доставки
+FSM_STORAGE = "memory"  # "memory" — в памяти процесса, "sql" — в таблице bot_fsm_state (общее для нескольких процессов, переживает перезапуск)
+FSM_STATE_TTL = 86_400  # Через сколько секунд бездействия состояние диалога сбрасывается
+FSM_STORAGE_CLEANUP_INTERVAL = 3600  # Как часто (в секундах) удалять устаревшие состояния